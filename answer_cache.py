@@ -0,0 +1,116 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from semantic_search import embed_texts
+
+logging.basicConfig(level=logging.INFO)
+
+# Cosine similarity a new question needs to an earlier one to reuse its answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))  # per namespace
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+
+_namespaces = {}  # name -> {"generation", "entries": OrderedDict(normalised query -> entry)}
+_lock = threading.Lock()
+_stats = {}
+
+
+def normalise(query):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", "", query.lower())).strip()
+
+
+def _bump(namespace, key):
+    counts = _stats.setdefault(namespace, {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0})
+    counts[key] += 1
+
+
+def _namespace(name, generation):
+    """Entries of a namespace, emptied when its generation (e.g. the KB index) has changed."""
+    space = _namespaces.get(name)
+    if space is None or space["generation"] != generation:
+        if space is not None and space["entries"]:
+            _bump(name, "invalidations")
+            logging.info(f"🧹 Answer cache '{name}' invalidated (generation {space['generation']} -> {generation})")
+        space = {"generation": generation, "entries": OrderedDict()}
+        _namespaces[name] = space
+    return space["entries"]
+
+
+def _embed(query):
+    try:
+        vector = np.asarray(embed_texts([query])[0], dtype="float32")
+        return vector / (np.linalg.norm(vector) or 1)
+    except Exception as e:
+        logging.warning(f"⚠️ Answer cache could not embed query: {e}")
+        return None
+
+
+def get_cached_answer(namespace, query, generation=None):
+    """An earlier answer to the same or a near-identical question, or None."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    key = normalise(query)
+    now = time.time()
+    with _lock:
+        entries = _namespace(namespace, generation)
+        for old_key in [k for k, e in entries.items() if now - e["created_at"] > ANSWER_CACHE_TTL_SECONDS]:
+            del entries[old_key]
+        entry = entries.get(key)
+        if entry:
+            entries.move_to_end(key)
+            _bump(namespace, "exact_hits")
+            return entry["answer"]
+        if not entries:
+            _bump(namespace, "misses")
+            return None
+
+    vector = _embed(query)
+    if vector is None:
+        with _lock:
+            _bump(namespace, "misses")
+        return None
+
+    with _lock:
+        entries = _namespace(namespace, generation)
+        keys = [k for k, e in entries.items() if e["vector"] is not None]
+        if keys:
+            similarities = np.vstack([entries[k]["vector"] for k in keys]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= ANSWER_CACHE_THRESHOLD:
+                entries.move_to_end(keys[best])
+                _bump(namespace, "semantic_hits")
+                return entries[keys[best]]["answer"]
+        _bump(namespace, "misses")
+        return None
+
+
+def put_cached_answer(namespace, query, answer, generation=None):
+    if not ANSWER_CACHE_ENABLED or not answer:
+        return
+    vector = _embed(query)
+    with _lock:
+        entries = _namespace(namespace, generation)
+        entries[normalise(query)] = {"answer": answer, "vector": vector, "created_at": time.time()}
+        entries.move_to_end(normalise(query))
+        while len(entries) > ANSWER_CACHE_MAX_ENTRIES:
+            entries.popitem(last=False)
+
+
+def answer_cache_stats():
+    with _lock:
+        stats = {}
+        for name, counts in _stats.items():
+            lookups = counts["exact_hits"] + counts["semantic_hits"] + counts["misses"]
+            space = _namespaces.get(name) or {"entries": {}, "generation": None}
+            stats[name] = dict(
+                counts,
+                entries=len(space["entries"]),
+                generation=space["generation"],
+                hit_rate=round((counts["exact_hits"] + counts["semantic_hits"]) / lookups, 3) if lookups else None,
+            )
+    return stats
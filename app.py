@@ -4,8 +4,7 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 import time
 import json
 import logging
-from flask import Flask, request, redirect, session, jsonify, send_from_directory
-from flask_session import Session
+from flask import Flask, Response, request, redirect, session, jsonify, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 from datetime import timedelta, datetime
@@ -20,7 +19,17 @@ from graph_api import (
     send_notification_email,
     send_multiple_file_email,
 )
-from openai_api import detect_intent_and_extract, answer_general_query
+from drive_catalog import catalog_stats
+from extraction_cache import cache_stats
+from file_index import index_stats
+from embedding_cache import embedding_stats
+from intent_classifier import classifier_stats
+from answer_cache import answer_cache_stats
+from http_client import http_stats
+from extractor import extraction_stats
+from session_store import init_session, session_stats
+from result_store import save_results, get_results, get_page, delete_results, compact_file, result_store_stats
+from openai_api import route_message, answer_general_query, stream_general_query
 from db import (
     init_db,
     save_message,
@@ -29,8 +38,8 @@ from db import (
     delete_old_messages,
     delete_old_chats,
 )
-from hr_router import handle_query
-from knowledge_base.build_index import build_index
+from hr_router import handle_query, stream_query, kb_stats
+from index_jobs import enqueue_index_job, get_index_job
 
 
 # 🌱 Load env and init logging
@@ -41,12 +50,9 @@ logging.basicConfig(level=logging.INFO)
 app = Flask(__name__, static_folder="./frontend/dist", static_url_path="/")
 app.secret_key = os.getenv("CLIENT_SECRET")
 CORS(app, supports_credentials=True)
-SESSION_DIR = os.path.join(os.getcwd(), "flask_session")
-os.makedirs(SESSION_DIR, exist_ok=True) 
-app.config["SESSION_TYPE"] = "filesystem"
 app.config["SESSION_PERMANENT"] = True
 app.permanent_session_lifetime = timedelta(hours=1)
-Session(app)
+init_session(app)  # SESSION_BACKEND: filesystem (default), sqlite or redis
 
 init_db()
 
@@ -56,6 +62,18 @@ def is_hr_admin(user_email):
     allowed = [e.strip().lower() for e in allowed_emails.split(",") if e.strip()]
     return user_email and user_email.lower() in allowed
 
+# 📁 Search results live in the result store; the session only carries the result-set id
+def _found_files_id():
+    result_id = session.get("found_files")
+    return result_id if isinstance(result_id, str) else None  # sessions from before the store held a list
+
+def set_found_files(files):
+    delete_results(_found_files_id())
+    session["found_files"] = save_results(files, owner=session.get("user_email")) if files else None
+
+def get_found_files():
+    return get_results(_found_files_id(), owner=session.get("user_email")) or []
+
 # 🔐 Auth
 @app.route("/login")
 def login():
@@ -99,7 +117,7 @@ def authorized():
     session["token"] = result["access_token"]
     session["chat_id"] = str(int(time.time()))
     session["stage"] = "start"
-    session["found_files"] = []
+    set_found_files([])
     save_token_cache(session["account_id"], cache)
 
     return redirect("/")
@@ -124,7 +142,7 @@ def check_login():
                 save_message(user_email, session["chat_id"], user_message=f"[TITLE]Chat - {timestamp}")
 
         session["stage"] = "start"
-        session["found_files"] = []
+        set_found_files([])
 
         return jsonify(
             logged_in=True,
@@ -135,6 +153,25 @@ def check_login():
     return jsonify(logged_in=False)
 
 
+@app.route("/api/metrics")
+def metrics():
+    if not session.get("user_email"):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "drive_catalog": catalog_stats(),
+        "extraction_cache": cache_stats(),
+        "file_index": index_stats(),
+        "embedding_cache": embedding_stats(),
+        "hr_knowledge_base": kb_stats(),
+        "intent_classifier": classifier_stats(),
+        "answer_cache": answer_cache_stats(),
+        "result_store": result_store_stats(),
+        "session": session_stats(),
+        "http": http_stats(),
+        "extraction": extraction_stats(),
+    })
+
+
 @app.route("/admin_emails", methods=["GET"])
 def get_admin_emails():
     emails = os.getenv("HR_ADMIN_EMAILS", "")
@@ -192,7 +229,9 @@ def upload_hr_doc():
 
     save_path = os.path.join("knowledge_base", "documents", filename)
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    file.save(save_path)
+    # Write then rename so a running index build never reads a half-written file
+    file.save(f"{save_path}.part")
+    os.replace(f"{save_path}.part", save_path)
 
     # Store uploader info
     metadata_path = os.path.join("knowledge_base", "index_metadata.json")
@@ -215,19 +254,26 @@ def upload_hr_doc():
     except Exception as e:
         logging.warning(f"⚠️ Failed to write metadata: {e}")
 
-    try:
-        build_index()
-        return jsonify({"message": "✅ File uploaded and indexed."})
-    except Exception as e:
-        return jsonify({"error": f"❌ Indexing failed: {e}"}), 500
-    
+    job_id = enqueue_index_job("upload", filename, user_email)
+    return jsonify({"message": "✅ File uploaded. Indexing queued.", "job_id": job_id}), 202
+
+
+@app.route("/api/index_jobs/<job_id>")
+def index_job_status(job_id):
+    if not is_hr_admin(session.get("user_email")):
+        return jsonify({"error": "❌ Unauthorized"}), 403
+    job = get_index_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
 
 @app.route("/api/skip_selection", methods=["POST"])
 def skip_selection():
     if not session.get("user_email"):
         return jsonify({"error": "Unauthorized"}), 401
     session["stage"] = "awaiting_query"
-    session["found_files"] = []
+    set_found_files([])
     return jsonify({"message": "Skipped selection"})
 
 
@@ -237,7 +283,7 @@ def session_state():
     return jsonify({
         "stage": session.get("stage"),
         "chat_id": session.get("chat_id"),
-        "files": session.get("found_files", [])
+        "files": get_found_files()
     })
 
 @app.route("/api/new_chat")
@@ -246,7 +292,7 @@ def new_chat():
         return jsonify({"error": "Unauthorized"}), 401
     session["chat_id"] = str(int(time.time()))
     session["stage"] = "start"
-    session["found_files"] = []
+    set_found_files([])
     return jsonify({"chat_id": session["chat_id"]})
 
 @app.route("/api/chats")
@@ -272,6 +318,8 @@ def chat():
     delete_old_chats(session.get("user_email"))
 
     user_input = request.json.get("message", "").strip()
+    # Opt-in: answers come back as server-sent events instead of one JSON body
+    stream = bool(request.json.get("stream", False))
     is_selection = request.json.get("selectionStage", False)
     selected_indices = request.json.get("selectedIndices")
     account_id = session.get("account_id") or "temp"
@@ -316,15 +364,26 @@ def chat():
 
     # ✅ Core interaction logic
     elif session.get("stage") == "awaiting_query":
-        gpt_result = detect_intent_and_extract(user_input)
-        intent = gpt_result.get("intent", "").lower()
-        query = gpt_result.get("data", "").strip()
-        logging.info(f"Detected intent: {intent}, query: {query}")
+        # One LLM call decides file search vs general and whether it is an HR question
+        route = route_message(user_input)
+        intent = route.get("intent", "").lower()
+        query = route.get("data", "").strip()
+        logging.info(f"Detected intent: {intent}, query: {query}, hr: {route.get('hr')}")
+        # A bare selection or "cancel" with no file list on screen
+        if intent == "control":
+            msg = "There's nothing to select right now. What file are you looking for?"
+            save_message(user_email, chat_id, ai_response=msg)
+            return jsonify(response=msg, intent="general_response")
         # ✅ HR assistant takes priority
-        hr_response = handle_query(user_input)
-        if hr_response and not hr_response.startswith("Knowledge base not found"):
-            save_message(user_email, chat_id, ai_response=hr_response)
-            return jsonify(response=hr_response, intent="hr_admin")
+        if stream:
+            hr_stream = stream_query(user_input, is_hr=route.get("hr"))
+            if hr_stream is not None:
+                return stream_answer(hr_stream, user_email, chat_id, "hr_admin")
+        else:
+            hr_response = handle_query(user_input, is_hr=route.get("hr"))
+            if hr_response and not hr_response.startswith("Knowledge base not found"):
+                save_message(user_email, chat_id, ai_response=hr_response)
+                return jsonify(response=hr_response, intent="hr_admin")
 
         # ✅ File search
         if intent == "file_search" and query and len(query) >= 2:
@@ -351,11 +410,11 @@ def chat():
                 return jsonify(response=msg, intent="file_search")
 
             session["stage"] = "awaiting_selection"
-            session["found_files"] = accessible
+            set_found_files(accessible)
 
             per_page = 5
             page = 1
-            paginated = accessible[:per_page]
+            paginated = [compact_file(f) for f in accessible[:per_page]]
 
             msg = "Please select file (e.g., 1,3):"
             save_message(user_email, chat_id, ai_response=msg)
@@ -375,6 +434,9 @@ def chat():
                 "allFileIds": [f["id"] for f in accessible]
             })
         
+        if stream:
+            return stream_answer(stream_general_query(user_input), user_email, chat_id, "general_response")
+
         # ✅ General questions fallback to ChatGPT-style response
         if intent == "general_response":
             gpt_answer = answer_general_query(user_input)
@@ -405,33 +467,44 @@ def paginate_files():
 
     filter_type = request.args.get("type", "").lower().strip()
 
-    files = session.get("found_files", [])
-
-    # Build the file type list from the full list before filtering
-    file_types = list(set([
-        os.path.splitext(f["name"])[1].lower()
-        for f in files
-        if "." in f["name"]
-    ]))
-
-    if filter_type:
-        files = [f for f in files if f["name"].lower().endswith(filter_type)]
-
+    # Only the requested page is read from the result store; file types come from the full list
     per_page = 5
-    total = len(files)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated = files[start:end]
+    result = get_page(_found_files_id(), page, per_page, filter_type, owner=session.get("user_email"))
+    result = result or {"files": [], "total": 0, "file_types": []}
 
     return jsonify({
-        "files": paginated,
+        "files": result["files"],
         "page": page,
-        "total": total,
-        "file_types": sorted(file_types)
+        "total": result["total"],
+        "file_types": result["file_types"]
+    })
+
+def stream_answer(pieces, user_email, chat_id, intent):
+    """
+    Server-sent events for an answer: a "token" event per piece as it arrives,
+    then a "done" event with the full text. The answer is saved at the end,
+    or whatever was sent if the client goes away first.
+    """
+    def events():
+        parts = []
+        try:
+            for piece in pieces:
+                parts.append(piece)
+                yield f"event: token\ndata: {json.dumps({'token': piece})}\n\n"
+        finally:
+            if hasattr(pieces, "close"):
+                pieces.close()
+            answer = "".join(parts).strip()
+            save_message(user_email, chat_id, ai_response=answer)
+        yield f"event: done\ndata: {json.dumps({'response': answer, 'intent': intent})}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a reverse proxy buffer the stream
     })
 
 def handle_file_selection(user_input, token, user_email, chat_id):
-    files = session.get("found_files", [])
+    files = get_found_files()
     if not files:
         session["stage"] = "awaiting_query"
         return jsonify(response="⚠️ File list expired", intent="error")
@@ -458,7 +531,7 @@ def handle_file_selection(user_input, token, user_email, chat_id):
 
     accessible = [
         f for f in selected_files
-        if check_file_access(token, f["id"], user_email, f.get("parentReference", {}).get("siteId"))
+        if check_file_access(token, f["id"], user_email, f["siteId"])
     ]
 
     if not accessible:
@@ -541,10 +614,8 @@ def delete_hr_doc():
             with open(metadata_path, "w") as f:
                 json.dump(metadata, f, indent=2)
 
-        # Rebuild index
-        build_index()
-
-        return jsonify({"message": f"✅ '{filename}' deleted and index updated."})
+        job_id = enqueue_index_job("delete", filename, user_email)
+        return jsonify({"message": f"✅ '{filename}' deleted. Index update queued.", "job_id": job_id}), 202
     except Exception as e:
         logging.exception("❌ Failed to delete document:")
         return jsonify({"error": f"❌ Deletion failed: {e}"}), 500
@@ -552,11 +623,7 @@ def delete_hr_doc():
 
 # 🏁 Startup
 if __name__ == "__main__":
-    try:
-        print("📦 Rebuilding HR knowledge base index...")
-        build_index()
-        print("✅ Index ready.")
-    except Exception as e:
-        print("⚠️ Index build failed:", e)
+    print("📦 Queuing HR knowledge base index update...")
+    enqueue_index_job("startup")
 
     app.run(debug=True)
\ No newline at end of file
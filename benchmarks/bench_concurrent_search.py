@@ -0,0 +1,156 @@
+"""
+Checks that concurrent searches don't leak into each other's rankings: two
+threads run rank_files, then search_all_files, at the same moment with
+different queries, and each must get exactly the ranking it gets when run
+alone. embed_texts is replaced by a bag-of-words stub with a small delay, so
+the two requests are interleaved inside the ranking. search_all_files runs
+against the fake Graph tenant (benchmarks/fake_graph.py).
+
+    python benchmarks/bench_concurrent_search.py --files 60 --rounds 20
+"""
+import os
+import sys
+import copy
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_graph import FakeGraph, serve as serve_graph
+
+TOPICS = {
+    "budget": "annual budget forecast spending cost centre finance approval",
+    "security": "security audit access review password phishing incident",
+    "travel": "travel expenses flights hotel per diem receipts claim",
+    "onboarding": "new starter onboarding induction laptop accounts buddy checklist",
+}
+QUERIES = ("budget 2023", "security audit")
+DIM = 128
+
+
+def stub_embed_texts(delay_ms):
+    def embed_texts(texts):
+        time.sleep(delay_ms / 1000)
+        vectors = []
+        for text in texts:
+            vector = [0.0] * DIM
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+            vectors.append(vector)
+        return vectors
+    return embed_texts
+
+
+def synthetic_files(n, rng):
+    files = []
+    for i in range(n):
+        topic = rng.choice(list(TOPICS))
+        year = rng.choice(["2022", "2023", "2024"])
+        words = TOPICS[topic].split()
+        text = f"{topic} {year} " + " ".join(rng.choice(words) for _ in range(30))
+        files.append({
+            "id": f"doc-{i}",
+            "name": f"{topic.title()} {rng.choice(words)} {year}.pdf",
+            "cTag": "1",
+            "extracted_text": text,
+        })
+    return files
+
+
+def run_together(calls):
+    """Run the calls on one thread each, released at the same moment. Returns their results in order."""
+    barrier = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def run(i, call):
+        barrier.wait()
+        results[i] = call()
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def check(label, search, rounds):
+    """search(query) -> ranking. Compares concurrent rankings with the ones each query gets alone."""
+    started = time.perf_counter()
+    expected = [search(q) for q in QUERIES]
+    serial_ms = (time.perf_counter() - started) * 1000
+    assert expected[0] != expected[1], "the two queries should rank differently"
+
+    started = time.perf_counter()
+    mismatches = 0
+    for _ in range(rounds):
+        got = run_together([lambda q=q: search(q) for q in QUERIES])
+        mismatches += sum(1 for g, e in zip(got, expected) if g != e)
+    concurrent_ms = (time.perf_counter() - started) * 1000 / rounds
+    print(f"{label:18} {rounds} rounds of {len(QUERIES)} concurrent queries: {mismatches} rankings differ from the serial run  "
+          f"(serial {serial_ms:.0f} ms, concurrent {concurrent_ms:.0f} ms per round)")
+    assert mismatches == 0, f"{label}: {mismatches} concurrent rankings differ from the serial ones"
+
+
+def build_tenant(files, rng):
+    graph = FakeGraph(sites=3, drives_per_site=1, hits_per_drive=0)
+    drives = [d["id"] for site_drives in graph.drives.values() for d in site_drives]
+    for i, f in enumerate(files):
+        drive_id = drives[i % len(drives)]
+        graph.files[f["id"]] = {
+            "id": f["id"],
+            "name": f["name"],
+            "webUrl": f"https://example.sharepoint.com/{f['id']}",
+            "file": {"mimeType": "application/pdf"},
+            "size": 4096,
+            "lastModifiedDateTime": f"2023-0{rng.randint(1, 9)}-01T00:00:00Z",
+            "parentReference": {"driveId": drive_id, "path": f"/drives/{drive_id}/root:/Documents"},
+        }
+        graph.contents[f["id"]] = f["extracted_text"]
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--embed-ms", type=float, default=5, help="delay of the stubbed embed_texts")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    files = synthetic_files(args.files, rng)
+    graph = build_tenant(files, rng)
+    _, graph_url = serve_graph(graph)
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        GRAPH_API_URL=graph_url, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-fake"), QUERY_TIME_EXTRACTION="true",
+        EXTRACTION_CACHE_DB=os.path.join(tmp, "extraction.db"), EMBEDDING_CACHE_DIR=os.path.join(tmp, "embeddings"),
+        FILE_INDEX_DB=os.path.join(tmp, "file_index.db"), FILE_INDEX_DIR=os.path.join(tmp, "file_index"),
+        DRIVE_CATALOG_DB=os.path.join(tmp, "catalog.db"), RESULT_STORE_DB=os.path.join(tmp, "result_store.db"),
+        OCR_WORKERS="1",
+    )
+    import semantic_search
+    import graph_api
+    import file_index
+    import drive_catalog
+
+    semantic_search.embed_texts = graph_api.embed_texts = stub_embed_texts(args.embed_ms)
+    file_index.init_file_index()
+    drive_catalog.refresh_catalog("fake-token", graph_api.discover_all_drives)
+
+    # Every request ranks its own copy of the files, as the app does
+    rank = lambda query: [(f["id"], f["hybrid_score"]) for f in semantic_search.rank_files(query, copy.deepcopy(files), top_k=None)]
+    check("rank_files", rank, args.rounds)
+
+    search = lambda query: [(f["id"], f.get("hybrid_score")) for f in graph_api.search_all_files("fake-token", query)]
+    check("search_all_files", search, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
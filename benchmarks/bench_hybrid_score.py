@@ -0,0 +1,151 @@
+"""
+Benchmark: rank_files end to end, as search_all_files calls it, against the
+previous per-candidate scorer on synthetic documents with the same FAISS
+stage. Covers candidates whose stored text is in the prebuilt term index
+(built once at index time, like file_index.build_file_index) and freshly
+extracted candidates that aren't. Checks both give the same ranking and scores.
+
+    python benchmarks/bench_hybrid_score.py --docs 10000 --candidates 40
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+import semantic_search
+from semantic_search import build_term_index, build_token_index, rank_files
+
+DIM = 64
+
+
+VOCAB = (
+    "report policy leave maternity sick annual budget invoice contract q1 q2 q3 q4 "
+    "sales marketing hr payroll onboarding handbook security audit minutes board "
+    "2019 2020 2021 2022 2023 2024 draft final summary plan review quarterly"
+).split()
+
+
+def legacy_rank_files(query, files):
+    """rank_files before the term index: same FAISS stage, then the per-candidate scorer kept verbatim."""
+    index = semantic_search.build_faiss_index(files)
+    query_vec = np.array(semantic_search.embed_texts([query])).astype("float32")
+    distances, indices = semantic_search.search_vectors(index, query_vec, len(files))
+    distances, indices = distances[0], indices[0]
+
+    def hybrid_score(file, distance):
+        text = (file.get("extracted_text") or file.get("name", "")).lower()
+        query_lower = query.lower()
+        keywords = query_lower.split()
+
+        exact_phrase_bonus = 0.2 if query_lower in text else 0
+        keyword_match_count = sum(1 for kw in keywords if kw in text)
+        keyword_bonus = 0.02 * keyword_match_count
+
+        year_bonus = 0
+        for word in keywords:
+            if word.isdigit() and len(word) == 4:
+                if word in text:
+                    year_bonus = 0.1
+                break
+
+        score = -float(distance) + exact_phrase_bonus + keyword_bonus + year_bonus
+        return float(score)
+
+    scored = []
+    for idx, dist in zip(indices, distances):
+        if 0 <= idx < len(files):
+            scored.append((files[idx]["id"], hybrid_score(files[idx], dist)))
+    return sorted(scored, key=lambda s: s[1], reverse=True)
+
+
+def synthetic_word(rng):
+    # Plurals, hyphenated compounds and trailing punctuation, so keywords also match inside longer tokens
+    word = rng.choice(VOCAB)
+    roll = rng.random()
+    if roll < 0.15:
+        word += "s"
+    elif roll < 0.2:
+        word += "-" + rng.choice(VOCAB)
+    elif roll < 0.25:
+        word = "pre" + word
+    return word + rng.choice(["", "", "", "", ",", ".", ";", ":", ")"])
+
+
+def synthetic_files(n, words_per_doc, rng, prefix="item"):
+    return [
+        {
+            "id": f"{prefix}-{i}", "cTag": "1", "name": f"doc-{i}.pdf",
+            "extracted_text": " ".join(synthetic_word(rng) for _ in range(words_per_doc)).title(),
+            "embedding": [rng.random() for _ in range(DIM)],  # stored vector, as the file index provides
+        }
+        for i in range(n)
+    ]
+
+
+def query_embedding(texts):
+    """Stands in for embed_texts: a fixed vector per query, no network."""
+    return [np.random.default_rng(abs(hash(t)) % 2 ** 32).random(DIM).tolist() for t in texts]
+
+
+def timed(fn, repeats):
+    """Median ms over repeats, and the last result. fn gets a fresh copy of the files each time."""
+    timings, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def compare(label, files, queries, repeats, term_index=None, versions=None):
+    print(f"\n{label}")
+    for query in queries:
+        legacy_ms, expected = timed(lambda: legacy_rank_files(query, [dict(f) for f in files]), repeats)
+
+        def current():
+            # As search_all_files calls it: token index over the candidates, then rank_files
+            candidates = [dict(f) for f in files]
+            token_index = build_token_index(candidates, term_index, versions)
+            return [(f["id"], f["hybrid_score"]) for f in rank_files(query, candidates, top_k=None, token_index=token_index)]
+        current_ms, got = timed(current, repeats)
+
+        print(f"{query!r:32} legacy {legacy_ms:8.2f} ms | rank_files {current_ms:8.2f} ms | "
+              f"x{legacy_ms / current_ms:5.2f} | identical ranking: {got == expected}")
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10000, help="indexed candidates")
+    parser.add_argument("--candidates", type=int, default=40, help="freshly extracted candidates")
+    parser.add_argument("--words", type=int, default=400, help="words per synthetic document")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    semantic_search.embed_texts = query_embedding
+    rng = random.Random(args.seed)
+    queries = ["q3 report", "maternity leave policy", "budget 2023", "annual security audit 2021", "handbook"]
+
+    indexed = synthetic_files(args.docs, args.words, rng)
+    started = time.perf_counter()
+    term_index = build_term_index((f["id"], f["cTag"], f["extracted_text"]) for f in indexed)
+    build_ms = (time.perf_counter() - started) * 1000
+    versions = {f["id"]: f["cTag"] for f in indexed}
+    print(f"Term index over {args.docs} docs built once at index time: {build_ms:.0f} ms, "
+          f"{len(term_index['suffix_offsets'])} vocabulary suffixes")
+    compare(f"{args.docs} candidates in the term index", indexed, queries, args.repeats, term_index, versions)
+
+    fresh = synthetic_files(args.candidates, args.words, rng, prefix="fresh")
+    compare(f"{args.candidates} freshly extracted candidates (not in the term index)", fresh, queries, args.repeats * 10, term_index, versions)
+
+
+if __name__ == "__main__":
+    main()
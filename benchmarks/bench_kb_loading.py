@@ -0,0 +1,83 @@
+"""
+Cold load + split time for the HR knowledge base loader stage at different
+process-pool sizes, on a synthetic corpus of PDFs and text files generated
+locally. Embedding is not included (it needs the OpenAI API).
+
+    python benchmarks/bench_kb_loading.py --files 1000 --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+from knowledge_base.build_index import iter_chunked_files, file_hash
+
+WORDS = (
+    "employee leave policy annual sick maternity paternity holiday allowance payroll "
+    "benefits pension onboarding probation notice period overtime expenses travel "
+    "remote working equipment security training grievance disciplinary appeal manager"
+).split()
+
+
+def paragraph(rng, words=120):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_corpus(directory, files, pages, rng):
+    """Two thirds PDFs with a text layer, one third plain text."""
+    for i in range(files):
+        if i % 3:
+            doc = fitz.open()
+            for _ in range(pages):
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n\n".join(paragraph(rng) for _ in range(4)), fontsize=9)
+            doc.save(os.path.join(directory, f"policy-{i}.pdf"))
+            doc.close()
+        else:
+            with open(os.path.join(directory, f"notes-{i}.txt"), "w") as f:
+                f.write("\n\n".join(paragraph(rng) for _ in range(pages * 4)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=5, help="pages per synthetic PDF")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="kb-corpus-")
+    try:
+        started = time.perf_counter()
+        generate_corpus(directory, args.files, args.pages, random.Random(args.seed))
+        print(f"Generated {args.files} documents in {time.perf_counter() - started:.1f}s ({directory})\n")
+        jobs = [
+            (name, os.path.join(directory, name), file_hash(os.path.join(directory, name)))
+            for name in sorted(os.listdir(directory))
+        ]
+
+        baseline = None
+        print(f"{'workers':>7} {'seconds':>8} {'files/s':>8} {'chunks':>7} {'speed-up':>8}")
+        for workers in args.workers:
+            started = time.perf_counter()
+            chunks = 0
+            for _, file_chunks, _, error in iter_chunked_files(jobs, workers=workers):
+                if error:
+                    raise error
+                chunks += len(file_chunks)
+            seconds = time.perf_counter() - started
+            baseline = baseline or seconds
+            print(f"{workers:7d} {seconds:8.2f} {len(jobs) / seconds:8.1f} {chunks:7d} {baseline / seconds:7.1f}x")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
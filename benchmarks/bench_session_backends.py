@@ -0,0 +1,198 @@
+"""
+Session read/write latency of the filesystem, SQLite and Redis-protocol
+session backends (session_store.py), plus a check that the chat flow and
+session expiry behave the same on each. Everything goes through the real
+app's /chat, /api/session_state and /api/paginate_files routes: greeting,
+a file search that stores its result set (stage awaiting_selection,
+found_files), then a numbered selection that sends the file and goes back to
+awaiting_query. Microsoft sign-in, the LLM router and Graph are replaced by
+in-process fakes; sessions, the result store and chat history are the real ones.
+The Redis backend runs against benchmarks/fake_redis.py unless --redis-url is given.
+
+    python benchmarks/bench_session_backends.py --threads 8 --requests 200
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_redis import FakeRedis, serve as serve_redis
+
+FILES = [
+    {
+        "id": f"item-{i}", "name": f"Q3 report {i}.pdf", "webUrl": f"https://example.sharepoint.com/item-{i}",
+        "siteId": "site-1", "parentReference": {"driveId": "drive-1", "siteId": "site-1"}, "size": 4096,
+    }
+    for i in range(1, 8)
+]
+
+
+class FakeMsal:
+    """Stands in for the MSAL app: the signed-in account always gets a token silently."""
+
+    def get_accounts(self):
+        return [{"home_account_id": "bench"}]
+
+    def acquire_token_silent(self, scopes, account):
+        return {"access_token": "t" * 2500}
+
+
+def patch_app(echo):
+    """Replace the calls that leave the process; the routes themselves run unchanged."""
+    echo.load_token_cache = lambda account_id: None
+    echo.save_token_cache = lambda account_id, cache: None
+    echo.build_msal_app = lambda cache=None: FakeMsal()
+    echo.route_message = lambda text: {"intent": "file_search", "data": text, "hr": False}
+    echo.handle_query = lambda text, is_hr=None: None
+    echo.search_all_files = lambda token, query: [dict(f) for f in FILES]
+    echo.check_file_access = lambda token, item_id, user_email, site_id=None: True
+    echo.send_multiple_file_email = lambda token, user_email, files: True
+    echo.print = lambda *args, **kwargs: None  # chat() prints every detected intent
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def sign_in(client, user_email="user@example.com"):
+    """The session /getAToken leaves behind after a successful sign-in."""
+    with client.session_transaction() as session:
+        session.update(
+            account_id="bench-account", user_email=user_email, token="t" * 2500,
+            chat_id=str(int(time.time())), stage="start",
+        )
+
+
+def chat(client, message):
+    response = client.post("/chat", json={"message": message})
+    assert response.status_code == 200, response.status_code
+    return response
+
+
+def timings(response):
+    """(read ms, write ms) from the Server-Timing header."""
+    parts = dict(p.strip().split(";dur=") for p in response.headers["Server-Timing"].split(","))
+    return float(parts["session-read"]), float(parts["session-write"])
+
+
+def check_chat_flow(app, backend):
+    client = app.test_client()
+    sign_in(client, f"{backend}@example.com")
+    state = lambda: client.get("/api/session_state").get_json()
+    stages = [state()["stage"]]
+
+    assert chat(client, "").get_json()["intent"] == "greeting"
+    stages.append(state()["stage"])
+
+    listed = chat(client, "q3 report").get_json()
+    assert listed["total"] == len(FILES) and len(listed["files"]) == 5, listed
+    current = state()
+    stages.append(current["stage"])
+    assert current["chat_id"] and [f["id"] for f in current["files"]] == [f["id"] for f in FILES]
+    page = client.get("/api/paginate_files?page=2").get_json()
+    assert [f["id"] for f in page["files"]] == [f["id"] for f in FILES[5:]], page
+
+    sent = chat(client, "1").get_json()
+    assert sent["intent"] == "file_sent" and FILES[0]["webUrl"] in sent["response"], sent
+    stages.append(state()["stage"])
+
+    expected = ["start", "awaiting_query", "awaiting_selection", "awaiting_query"]
+    assert stages == expected, f"{backend}: stages {stages}, expected {expected}"
+
+
+def check_expiry(app, lifetime_seconds):
+    """An idle session is gone after its lifetime; a later write sweeps it from the store."""
+    app.permanent_session_lifetime = timedelta(seconds=lifetime_seconds)
+    idle = app.test_client()
+    sign_in(idle)
+    time.sleep(lifetime_seconds + 0.5)
+    expired = idle.get("/api/session_state").get_json()["stage"] is None
+    sign_in(app.test_client())
+    app.permanent_session_lifetime = timedelta(hours=1)
+    return expired
+
+
+def run_load(app, threads, requests):
+    reads, writes = [], []
+    lock = threading.Lock()
+
+    def worker(n):
+        client = app.test_client()
+        sign_in(client, f"load-{n}@example.com")
+        chat(client, "")
+        local_reads, local_writes = [], []
+        for i in range(requests):
+            # Alternate a search and a selection, so every request reads and rewrites the session
+            read_ms, write_ms = timings(chat(client, "1" if i % 2 else "q3 report"))
+            local_reads.append(read_ms)
+            local_writes.append(write_ms)
+        with lock:
+            reads.extend(local_reads)
+            writes.extend(local_writes)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    p95 = lambda values: sorted(values)[int(len(values) * 0.95) - 1]
+    return {
+        "requests_per_s": len(reads) / elapsed,
+        "read_median": statistics.median(reads), "read_p95": p95(reads),
+        "write_median": statistics.median(writes), "write_p95": p95(writes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per thread")
+    parser.add_argument("--redis-url", help="a real Redis instead of the fake one")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)  # the filesystem backend, chat history and token cache use the working directory
+    fake = None
+    if not args.redis_url:
+        fake = FakeRedis()
+        _, args.redis_url = serve_redis(fake)
+    os.environ.update(
+        SESSION_BACKEND="filesystem", SESSION_SQLITE_DB=os.path.join(tmp, "sessions.db"),
+        SESSION_REDIS_URL=args.redis_url, SESSION_SWEEP_SECONDS="1",
+        RESULT_STORE_DB=os.path.join(tmp, "result_store.db"), TOKEN_DB_PATH=f"sqlite:///{tmp}/token_cache.db",
+        CLIENT_SECRET="bench", SCOPE="User.Read", OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-fake"),
+        PERFORM_ACCESS_CHECK="true",
+    )
+    import app as echo
+    import session_store
+
+    patch_app(echo)
+    app = echo.app
+    print(f"{args.threads} threads x {args.requests} /chat requests, each reading and writing its session\n")
+    failures = []
+    for backend in ("filesystem", "sqlite", "redis"):
+        session_store.init_session(app, backend)
+        check_chat_flow(app, backend)
+        expired = check_expiry(app, lifetime_seconds=2)
+        if not expired:
+            failures.append(f"{backend}: session still readable after its lifetime")
+
+        result = run_load(app, args.threads, args.requests)
+        print(f"{backend:10}  chat flow ok  expired after lifetime {'yes' if expired else 'NO'}  "
+              f"{result['requests_per_s']:7.0f} req/s  read median {result['read_median']:.2f} ms p95 {result['read_p95']:.2f} ms  "
+              f"write median {result['write_median']:.2f} ms p95 {result['write_p95']:.2f} ms")
+
+    stats = session_store.session_stats()
+    print(f"\nSQLite sweeps {stats['sweeps']}, expired sessions deleted {stats['expired_deleted']}"
+          + (f"; fake Redis keys expired {fake.expired}" if fake else ""))
+    assert not failures, "; ".join(failures)
+
+
+if __name__ == "__main__":
+    main()
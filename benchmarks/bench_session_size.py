@@ -0,0 +1,113 @@
+"""
+Per-request session size and /api/paginate_files latency with search results
+kept in the Flask filesystem session (before) vs. in the result store with
+only the result-set id in the session (after). Uses the app's session setup
+(Flask-Session, filesystem) and synthetic ranked Graph items with extracted text.
+
+    python benchmarks/bench_session_size.py --files 60 --text-kb 8 --requests 50
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def graph_item(i, text_kb, rng):
+    """A ranked search hit as search_all_files returns it."""
+    item_id = f"01ABCDEF{i:08d}GHIJKLMNOP"
+    return {
+        "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#drives('b!x')/items/$entity",
+        "@microsoft.graph.downloadUrl": f"https://example.sharepoint.com/sites/s/_layouts/15/download.aspx?UniqueId={item_id}&tempauth={'x' * 600}",
+        "createdDateTime": "2024-01-01T00:00:00Z",
+        "eTag": f"\"{{{item_id}}},3\"",
+        "id": item_id,
+        "lastModifiedDateTime": "2024-03-01T00:00:00Z",
+        "name": f"Quarterly report {i} {rng.choice(['2023', '2024'])}.{rng.choice(['pdf', 'docx', 'xlsx'])}",
+        "webUrl": f"https://example.sharepoint.com/sites/s/Shared%20Documents/Reports/Quarterly%20report%20{i}.pdf",
+        "cTag": f"\"c:{{{item_id}}},3\"",
+        "size": 1024 * rng.randint(50, 5000),
+        "createdBy": {"user": {"email": "a@example.com", "id": "u1", "displayName": "A User"}},
+        "lastModifiedBy": {"user": {"email": "b@example.com", "id": "u2", "displayName": "B User"}},
+        "parentReference": {
+            "driveType": "documentLibrary", "driveId": "b!" + "d" * 60, "id": "01PARENT",
+            "name": "Reports", "path": "/drives/b!x/root:/Reports", "siteId": "example.sharepoint.com,1111,2222",
+        },
+        "file": {"mimeType": "application/pdf", "hashes": {"quickXorHash": "q" * 28}},
+        "fileSystemInfo": {"createdDateTime": "2024-01-01T00:00:00Z", "lastModifiedDateTime": "2024-03-01T00:00:00Z"},
+        "shared": {"scope": "users"},
+        "extracted_text": " ".join(rng.choice(["revenue", "growth", "quarter", "region", "target", "forecast"]) for _ in range(text_kb * 150)),
+        "hybrid_score": -rng.random(),
+    }
+
+
+def make_app(session_dir, use_store):
+    from flask import Flask, session, jsonify, request
+    from flask_session import Session
+    from result_store import save_results, get_page, compact_file
+
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    app.config["SESSION_TYPE"] = "filesystem"
+    app.config["SESSION_FILE_DIR"] = session_dir
+    app.config["SESSION_PERMANENT"] = True
+    Session(app)
+
+    @app.route("/search")
+    def search():
+        files = app.config["FILES"]
+        session.update(user_email="user@example.com", token="t" * 2500, chat_id="1700000000", stage="awaiting_selection")
+        session["found_files"] = save_results(files, owner=session["user_email"]) if use_store else files
+        return jsonify(files=[compact_file(f) for f in files[:5]])
+
+    @app.route("/paginate")
+    def paginate():
+        page = int(request.args.get("page", 1))
+        if use_store:
+            return jsonify(get_page(session["found_files"], page, 5, owner=session["user_email"]))
+        files = session.get("found_files", [])
+        file_types = sorted({os.path.splitext(f["name"])[1].lower() for f in files if "." in f["name"]})
+        return jsonify(files=files[(page - 1) * 5:page * 5], total=len(files), file_types=file_types)
+
+    return app
+
+
+def session_bytes(session_dir):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, names in os.walk(session_dir) for f in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=60, help="ranked files in the result list")
+    parser.add_argument("--text-kb", type=int, default=8, help="extracted text per file")
+    parser.add_argument("--requests", type=int, default=50, help="paginate requests timed")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    files = [graph_item(i, args.text_kb, rng) for i in range(args.files)]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["RESULT_STORE_DB"] = os.path.join(tmp, "result_store.db")
+        print(f"{args.files} results, ~{args.text_kb} KB extracted text each\n")
+        for label, use_store in (("session (before)", False), ("result store", True)):
+            session_dir = os.path.join(tmp, label.split()[0])
+            app = make_app(session_dir, use_store)
+            app.config["FILES"] = [dict(f) for f in files]
+            client = app.test_client()
+            client.get("/search")
+            size = session_bytes(session_dir)
+            timings = []
+            for i in range(args.requests):
+                started = time.perf_counter()
+                res = client.get(f"/paginate?page={i % 5 + 1}")
+                timings.append((time.perf_counter() - started) * 1000)
+                assert res.status_code == 200 and len(res.get_json()["files"]) == 5
+            print(f"{label:17} session {size / 1024:9.1f} KB   paginate median {statistics.median(timings):6.2f} ms  "
+                  f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
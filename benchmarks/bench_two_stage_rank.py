@@ -0,0 +1,155 @@
+"""
+Latency and ranking quality of the two-stage file search ranker against the
+previous behaviour of extracting and embedding every hit (SEARCH_RERANK_TOP_N=0).
+
+A fake Graph tenant (benchmarks/fake_graph.py) serves a corpus of PDFs with a
+fixed download delay, and a mock OpenAI API (benchmarks/mock_llm.py) serves
+bag-of-words embeddings so similar texts get similar vectors. Every setting
+runs search_all_files in a fresh process with empty caches and
+QUERY_TIME_EXTRACTION on, so every candidate has to be downloaded.
+
+    python benchmarks/bench_two_stage_rank.py --files 300 --download-ms 80 --top-n 0 5 10 20 40
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_graph import FakeGraph, serve as serve_graph
+from benchmarks.mock_llm import MockLLM, serve as serve_llm
+
+TOPICS = {
+    "budget": "annual budget forecast spending cost centre finance approval",
+    "onboarding": "new starter onboarding induction laptop accounts buddy checklist",
+    "security": "security audit access review password phishing incident",
+    "sales": "sales pipeline revenue quarter targets accounts region",
+    "travel": "travel expenses flights hotel per diem receipts claim",
+    "maternity": "maternity leave pay weeks notice return to work",
+}
+FILLER = "meeting agenda minutes notes draft summary update review team project plan".split()
+
+
+class BagOfWordsLLM(MockLLM):
+    def embedding(self, text):
+        vector = [0.0] * self.dim
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vector
+
+
+def build_corpus(graph, files, query_topic, seed=7):
+    """
+    Files about the query topic named after it, about it under a generic scan
+    name, mentioning it in passing, or about something else that shares a
+    word with the query. Returns {item id: relevance} (2, 1 or 0).
+    """
+    rng = random.Random(seed)
+    drives = [d["id"] for site_drives in graph.drives.values() for d in site_drives]
+    relevance = {}
+    for i in range(files):
+        item_id = f"doc-{i}"
+        drive_id = drives[i % len(drives)]
+        year = rng.choice(["2022", "2023", "2024"])
+        kind = rng.random()
+        topic = rng.choice([t for t in TOPICS if t != query_topic])
+        if kind < 0.06:
+            name, content, grade = f"{query_topic.title()} {year} final.pdf", f"{query_topic} {year} " + TOPICS[query_topic] * 3, 2
+        elif kind < 0.12:
+            name, content, grade = f"Scan_{i:04d}.pdf", f"{query_topic} {year} " + TOPICS[query_topic] * 3, 2
+        elif kind < 0.35:
+            name = f"{rng.choice(FILLER).title()} {rng.choice(FILLER)} {year}.pdf"
+            content, grade = " ".join(rng.choice(FILLER) for _ in range(40)) + f" {query_topic} {year}", 1
+        else:
+            name = f"{topic.title()} {rng.choice(FILLER)} {year}.pdf"
+            content, grade = f"{topic} {year} " + TOPICS[topic] * 3 + f" {query_topic}", 0
+        graph.files[item_id] = {
+            "id": item_id,
+            "name": name,
+            "webUrl": f"https://example.sharepoint.com/{item_id}",
+            "file": {"mimeType": "application/pdf"},
+            "size": 4096,
+            "lastModifiedDateTime": f"{year}-0{rng.randint(1, 9)}-01T00:00:00Z",
+            "parentReference": {"driveId": drive_id, "path": f"/drives/{drive_id}/root:/{topic.title()}"},
+        }
+        graph.contents[item_id] = content
+        relevance[item_id] = grade
+    return relevance
+
+
+def run_search(query):
+    """Child process: one search_all_files call, printed as JSON."""
+    import file_index
+    import graph_api
+    import drive_catalog
+    file_index.init_file_index()
+    drive_catalog.refresh_catalog("fake-token", graph_api.discover_all_drives)
+    started = time.perf_counter()
+    ranked = graph_api.search_all_files("fake-token", query)
+    print(json.dumps({"seconds": time.perf_counter() - started, "ids": [f["id"] for f in ranked]}))
+
+
+def ndcg(ids, relevance, k):
+    gains = [relevance.get(i, 0) for i in ids[:k]]
+    ideal = sorted(relevance.values(), reverse=True)[:k]
+    dcg = lambda g: sum((2 ** r - 1) / math.log2(n + 2) for n, r in enumerate(g))
+    return dcg(gains) / (dcg(ideal) or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--sites", type=int, default=5)
+    parser.add_argument("--download-ms", type=int, default=80, help="delay per file download")
+    parser.add_argument("--query", default="budget 2023")
+    parser.add_argument("--top-n", type=int, nargs="+", default=[0, 5, 10, 20, 40])
+    parser.add_argument("--run-search", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_search:
+        return run_search(args.query)
+
+    graph = FakeGraph(args.sites, 1, 0, download_ms=args.download_ms)
+    relevance = build_corpus(graph, args.files, args.query.split()[0])
+    graph_server, graph_url = serve_graph(graph)
+    llm = BagOfWordsLLM(latency_ms=0, token_ms=0)
+    llm_server, llm_url = serve_llm(llm)
+    print(f"{args.files} files, query '{args.query}', {args.download_ms} ms per download\n")
+
+    for top_n in args.top_n:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                GRAPH_API_URL=graph_url, OPENAI_BASE_URL=llm_url, OPENAI_API_KEY="sk-mock",
+                QUERY_TIME_EXTRACTION="true", SEARCH_RERANK_TOP_N=str(top_n),
+                EXTRACTION_CACHE_DB=os.path.join(tmp, "extraction.db"), EMBEDDING_CACHE_DIR=os.path.join(tmp, "embeddings"),
+                FILE_INDEX_DB=os.path.join(tmp, "file_index.db"), FILE_INDEX_DIR=os.path.join(tmp, "file_index"),
+                DRIVE_CATALOG_DB=os.path.join(tmp, "catalog.db"), OCR_WORKERS="1",
+            )
+            graph.counts.clear()
+            llm.calls.clear()
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-search", "--query", args.query],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+
+        ids = result["ids"]
+        label = "all hits (before)" if top_n == 0 else f"top {top_n}"
+        print(f"{label:18} {result['seconds'] * 1000:7.0f} ms  results {len(ids):4}  downloads {graph.counts['download']:4}  "
+              f"nDCG@5 {ndcg(ids, relevance, 5):.3f}  nDCG@10 {ndcg(ids, relevance, 10):.3f}  "
+              f"nDCG@20 {ndcg(ids, relevance, 20):.3f}")
+
+    graph_server.shutdown()
+    llm_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
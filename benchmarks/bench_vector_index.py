@@ -0,0 +1,76 @@
+"""
+Recall@k vs latency for the FAISS index factory in semantic_search, on synthetic
+clustered embeddings. Use it to pick FAISS_INDEX_TYPE / nprobe / efSearch for a
+deployment size.
+
+    python benchmarks/bench_vector_index.py --size 500000 --dim 256
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+from semantic_search import build_vector_index, search_vectors
+
+
+def synthetic_embeddings(size, dim, queries, clusters, rng):
+    """Gaussian clusters roughly mimic the topical structure of document embeddings."""
+    centres = rng.standard_normal((clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, size + queries)
+    points = centres[labels] + 1.5 * rng.standard_normal((size + queries, dim)).astype("float32")
+    return points[:size], points[size:]
+
+
+def measure(index, queries, truth, k):
+    started = time.perf_counter()
+    _, ids = search_vectors(index, queries, k)
+    per_query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    recall = np.mean([len(set(found) & set(expected)) / k for found, expected in zip(ids, truth)])
+    return recall, per_query_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus, queries = synthetic_embeddings(args.size, args.dim, args.queries, args.clusters, rng)
+    print(f"{args.size} vectors, dim {args.dim}, {args.queries} queries, recall@{args.k}\n")
+    print(f"{'config':28} {'build s':>8} {'recall':>7} {'ms/query':>9}")
+
+    started = time.perf_counter()
+    flat = build_vector_index(corpus, kind="flat")
+    build_s = time.perf_counter() - started
+    _, truth = search_vectors(flat, queries, args.k)
+    recall, ms = measure(flat, queries, truth, args.k)
+    print(f"{'flat (exact)':28} {build_s:8.1f} {recall:7.3f} {ms:9.3f}")
+
+    started = time.perf_counter()
+    ivf = build_vector_index(corpus, kind="ivf")
+    build_s = time.perf_counter() - started
+    for nprobe in (1, 4, 16, 64):
+        ivf.nprobe = nprobe
+        recall, ms = measure(ivf, queries, truth, args.k)
+        print(f"{f'ivf nlist={ivf.nlist} nprobe={nprobe}':28} {build_s:8.1f} {recall:7.3f} {ms:9.3f}")
+
+    started = time.perf_counter()
+    hnsw = build_vector_index(corpus, kind="hnsw")
+    build_s = time.perf_counter() - started
+    for ef_search in (16, 32, 64, 128):
+        hnsw.hnsw.efSearch = ef_search
+        recall, ms = measure(hnsw, queries, truth, args.k)
+        print(f"{f'hnsw M={hnsw.hnsw.nb_neighbors(1)} efSearch={ef_search}':28} {build_s:8.1f} {recall:7.3f} {ms:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Offline evaluation of the local intent classifier: leave-one-out accuracy on
+intent_examples.json (or a separate labelled file) against the share of
+messages decided locally, for a range of thresholds, plus per-label precision
+and per-message latency. Only INTENT_FAST_PATH_LABELS count as local decisions.
+
+    python benchmarks/eval_intent_classifier.py
+    python benchmarks/eval_intent_classifier.py --eval-file my_labelled.json
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_classifier import CentroidClassifier, load_examples, INTENT_FAST_PATH_THRESHOLD, INTENT_FAST_PATH_LABELS
+
+THRESHOLDS = (0.0, 0.05, 0.08, 0.12, 0.16, 0.2, 0.3)
+
+
+def leave_one_out(examples):
+    """(true label, predicted label, confidence) for each example, predicted by a model trained without it."""
+    results = []
+    for label, texts in examples.items():
+        for i, text in enumerate(texts):
+            held_out = dict(examples)
+            held_out[label] = texts[:i] + texts[i + 1:]
+            predicted, confidence, _ = CentroidClassifier(held_out).predict(text)
+            results.append((label, predicted, confidence))
+    return results
+
+
+def held_out_file(examples, path):
+    classifier = CentroidClassifier(examples)
+    return [
+        (label, *classifier.predict(text)[:2])
+        for label, texts in load_examples(path).items()
+        for text in texts
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval-file", help="labelled messages in the intent_examples.json format")
+    args = parser.parse_args()
+
+    examples = load_examples()
+    results = held_out_file(examples, args.eval_file) if args.eval_file else leave_one_out(examples)
+    print(f"{len(results)} labelled messages ({'held-out file' if args.eval_file else 'leave-one-out'})\n")
+    print(f"{'threshold':>9} {'local':>7} {'local acc':>9} {'errors':>6}")
+    for threshold in sorted(set(THRESHOLDS + (INTENT_FAST_PATH_THRESHOLD,))):
+        decided = [(t, p) for t, p, c in results if c >= threshold and p in INTENT_FAST_PATH_LABELS]
+        correct = sum(1 for t, p in decided if t == p)
+        accuracy = correct / len(decided) if decided else float("nan")
+        marker = "  <- INTENT_FAST_PATH_THRESHOLD" if threshold == INTENT_FAST_PATH_THRESHOLD else ""
+        print(f"{threshold:9.2f} {len(decided) / len(results):7.1%} {accuracy:9.1%} {len(decided) - correct:6d}{marker}")
+
+    print(f"\nPer-label precision at threshold {INTENT_FAST_PATH_THRESHOLD} (* = decided locally)")
+    for label in sorted(examples):
+        predicted = [t for t, p, c in results if p == label and c >= INTENT_FAST_PATH_THRESHOLD]
+        precision = sum(1 for t in predicted if t == label) / len(predicted) if predicted else float("nan")
+        marker = "*" if label in INTENT_FAST_PATH_LABELS else " "
+        print(f"  {marker} {label:12} {len(predicted):4d} predicted  {precision:6.1%} precision")
+
+    classifier = CentroidClassifier(examples)
+    messages = [text for texts in examples.values() for text in texts]
+    timings = []
+    for _ in range(20):
+        for text in messages:
+            started = time.perf_counter()
+            classifier.predict(text)
+            timings.append((time.perf_counter() - started) * 1000)
+    print(f"\nLatency per message: p50 {np.percentile(timings, 50):.3f} ms, p99 {np.percentile(timings, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
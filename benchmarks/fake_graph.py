@@ -0,0 +1,208 @@
+"""
+Local fake Microsoft Graph server for measuring how many requests the file
+search issues. Serves a synthetic tenant of sites, drives and files. Run
+directly, it checks find_graph_files against it and exits with an error if a
+seeded file is missed, metadata takes more than ceil(hits / 20) $batch calls,
+or more connections are opened than HTTP_HOST_CONCURRENCY.
+
+    python benchmarks/fake_graph.py --sites 20 --drives 2 --hits 15
+"""
+import os
+import sys
+import json
+import re
+import math
+import time
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeGraph:
+    def __init__(self, sites=20, drives_per_site=2, hits_per_drive=15, download_ms=0):
+        self.sites = [{"id": f"site-{s}", "name": f"Site {s}"} for s in range(sites)]
+        self.drives = {
+            site["id"]: [{"id": f"{site['id']}-drive-{d}", "name": "Documents"} for d in range(drives_per_site)]
+            for site in self.sites
+        }
+        self.files = {}
+        self.contents = {}  # item id -> text of the served PDF (and matched by search, like Graph full-text)
+        self.download_delay = download_ms / 1000
+        self._pdfs = {}
+        self.connections = 0
+        for site_drives in list(self.drives.values()) + [[{"id": "me-drive"}]]:
+            for drive in site_drives:
+                for i in range(hits_per_drive):
+                    item_id = f"{drive['id']}-item-{i}"
+                    self.files[item_id] = {
+                        "id": item_id,
+                        "name": f"Q{i % 4 + 1} report {2020 + i % 5} {item_id}.pdf",
+                        "webUrl": f"https://example.sharepoint.com/{item_id}",
+                        "file": {"mimeType": "application/pdf"},
+                        "size": 1024 * (i + 1),
+                        "lastModifiedDateTime": f"202{i % 5}-0{i % 9 + 1}-01T00:00:00Z",
+                        "parentReference": {"driveId": drive["id"], "path": f"/drives/{drive['id']}/root:/Reports"},
+                    }
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def drive_hits(self, drive_id, q):
+        words = q.lower().split()
+        return [
+            dict(f) for f in self.files.values()
+            if f["parentReference"]["driveId"] == drive_id
+            and all(w in f"{f['name']} {self.contents.get(f['id'], '')}".lower() for w in words)
+        ]
+
+    def pdf(self, item_id):
+        """A one-page PDF with the item's content (or name) as its text layer."""
+        with self.lock:
+            if item_id not in self._pdfs:
+                import fitz
+                doc = fitz.open()
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(50, 50, 550, 800), self.contents.get(item_id) or self.files[item_id]["name"])
+                self._pdfs[item_id] = doc.tobytes()
+            return self._pdfs[item_id]
+
+    def item(self, item_id, base_url):
+        f = dict(self.files[item_id])
+        f["@microsoft.graph.downloadUrl"] = f"{base_url}/download/{item_id}"
+        return f
+
+    def route(self, path, base_url):
+        if path.startswith("/sites?"):
+            return "sites", 200, {"value": self.sites}
+        m = re.match(r"^/sites/([^/]+)/drives$", path)
+        if m:
+            return "drives", 200, {"value": self.drives.get(m.group(1), [])}
+        m = re.match(r"^/(?:me/drive/root|drives/([^/]+))/search\(q='(.*)'\)$", path)
+        if m:
+            return "search", 200, {"value": self.drive_hits(m.group(1) or "me-drive", m.group(2))}
+        m = re.match(r"^/drives/([^/]+)/items/([^/?]+)", path)
+        if m:
+            if m.group(2) in self.files:
+                return "item", 200, self.item(m.group(2), base_url)
+            return "item", 404, {"error": {"code": "itemNotFound"}}
+        return "other", 404, {"error": {"code": "notFound"}}
+
+    def handle_get(self, path, base_url):
+        kind, status, payload = self.route(path, base_url)
+        self.count(kind)
+        return status, payload
+
+    def handle_batch(self, body, base_url):
+        self.count("batch")
+        responses = []
+        for sub in body.get("requests", []):
+            kind, status, payload = self.route(sub["url"], base_url)
+            self.count(f"batched_{kind}")
+            responses.append({"id": sub["id"], "status": status, "body": payload})
+        return 200, {"responses": responses}
+
+
+def serve(graph, port=0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse shows up in the counts
+
+        def setup(self):
+            super().setup()
+            graph.connections += 1
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = unquote(self.path[len("/v1.0"):])
+            if path.startswith("/download/") and path[len("/download/"):] in graph.files:
+                graph.count("download")
+                time.sleep(graph.download_delay)
+                data = graph.pdf(path[len("/download/"):])
+                self.send_response(200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self._reply(*graph.handle_get(path, base_url))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/v1.0/$batch":
+                self._reply(*graph.handle_batch(body, base_url))
+            else:
+                self._reply(404, {})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1.0"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--drives", type=int, default=2)
+    parser.add_argument("--hits", type=int, default=15, help="matching files per drive")
+    parser.add_argument("--query", default="report")
+    args = parser.parse_args()
+
+    graph = FakeGraph(args.sites, args.drives, args.hits)
+    server, base_url = serve(graph)
+    os.environ["GRAPH_API_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+    import graph_api
+    import drive_catalog
+    import http_client
+
+    drive_catalog.refresh_catalog("fake-token", graph_api.discover_all_drives)
+    graph.counts.clear()
+
+    found = graph_api.find_graph_files("fake-token", [args.query])
+    hits = len(found)
+    print(f"Found {hits} files with download URLs")
+    print(f"Requests: {dict(graph.counts)}")
+    print(f"Metadata round trips: {graph.counts['batch'] + graph.counts['item']} "
+          f"(per-hit lookups would need {hits}, i.e. O(hits) vs O(hits/{graph_api.GRAPH_BATCH_SIZE}))")
+    print(f"TCP connections opened: {graph.connections} for all {sum(s['requests'] for s in http_client.http_stats().values())} "
+          f"requests, catalog refresh included")
+    print(f"Client stats: {http_client.http_stats()}")
+    server.shutdown()
+
+    # Fail loudly when the search regresses: every seeded file found, metadata in
+    # $batch calls rather than per hit, and connections reused across requests
+    drives = args.sites * args.drives + 1  # plus /me/drive
+    expected_hits = drives * args.hits
+    max_batches = math.ceil(expected_hits / graph_api.GRAPH_BATCH_SIZE)
+    requests = sum(s["requests"] for s in http_client.http_stats().values())
+    assert hits == expected_hits, f"found {hits} files, expected {expected_hits}"
+    assert graph.counts["search"] == drives, f"{graph.counts['search']} search calls for {drives} drives"
+    assert graph.counts["item"] == 0, f"{graph.counts['item']} per-hit metadata lookups, expected none"
+    assert graph.counts["batch"] <= max_batches, f"{graph.counts['batch']} $batch calls, expected at most {max_batches}"
+    assert graph.connections <= http_client.HTTP_HOST_CONCURRENCY, (
+        f"{graph.connections} connections for {requests} requests, expected at most "
+        f"{http_client.HTTP_HOST_CONCURRENCY} (one per concurrent request slot)"
+    )
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
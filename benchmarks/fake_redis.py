@@ -0,0 +1,144 @@
+"""
+Minimal in-memory Redis-protocol server (RESP2, or RESP3 after HELLO 3):
+enough of GET/SET (EX/PX)/DEL/EXISTS/TTL/KEYS/DBSIZE/FLUSHDB for the redis
+session backend to run against without a real Redis. Keys expire lazily on access and in a background sweep,
+like Redis itself.
+
+    python benchmarks/fake_redis.py --port 6390
+    SESSION_BACKEND=redis SESSION_REDIS_URL=redis://127.0.0.1:6390/0 python app.py
+"""
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+
+
+class FakeRedis:
+    def __init__(self, sweep_seconds=0.1):
+        self.data = {}
+        self.expires = {}  # key -> monotonic deadline
+        self.expired = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._sweep_loop, args=(sweep_seconds,), daemon=True).start()
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            self.expired += 1
+        return key in self.data
+
+    def _sweep_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                for key in list(self.expires):
+                    self._alive(key)
+
+    def execute(self, args):
+        command = args[0].upper()
+        with self.lock:
+            if command == b"PING":
+                return "+PONG"
+            if command in (b"CLIENT", b"SELECT"):
+                return "+OK"
+            if command == b"HELLO":
+                # Server info as a RESP3 map when asked for protocol 3, a flat array otherwise
+                info = [b"server", b"redis", b"version", b"7.0.0", b"proto", int(args[1]) if len(args) > 1 else 2]
+                return ("map", info) if len(args) > 1 and args[1] == b"3" else info
+            if command == b"GET":
+                return self.data[args[1]] if self._alive(args[1]) else None
+            if command == b"SET":
+                key, value, ttl = args[1], args[2], None
+                options = [a.upper() for a in args[3:]]
+                if b"EX" in options:
+                    ttl = int(args[3 + options.index(b"EX") + 1])
+                elif b"PX" in options:
+                    ttl = int(args[3 + options.index(b"PX") + 1]) / 1000
+                self.data[key] = value
+                if ttl is None:
+                    self.expires.pop(key, None)
+                else:
+                    self.expires[key] = time.monotonic() + ttl
+                return "+OK"
+            if command == b"DEL":
+                removed = sum(1 for key in args[1:] if self._alive(key) and self.data.pop(key, None) is not None)
+                for key in args[1:]:
+                    self.expires.pop(key, None)
+                return removed
+            if command == b"EXISTS":
+                return sum(1 for key in args[1:] if self._alive(key))
+            if command == b"TTL":
+                if not self._alive(args[1]):
+                    return -2
+                deadline = self.expires.get(args[1])
+                return -1 if deadline is None else int(deadline - time.monotonic())
+            if command == b"KEYS":
+                pattern = args[1].decode()
+                return [k for k in list(self.data) if self._alive(k) and fnmatch.fnmatchcase(k.decode(), pattern)]
+            if command == b"DBSIZE":
+                return sum(1 for k in list(self.data) if self._alive(k))
+            if command == b"FLUSHDB":
+                self.data.clear()
+                self.expires.clear()
+                return "+OK"
+        return f"-ERR unknown command '{command.decode()}'"
+
+
+def encode(reply, resp3=False):
+    if reply is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(reply, str):
+        return f"{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, tuple):
+        return b"%%%d\r\n" % (len(reply[1]) // 2) + b"".join(encode(r, resp3) for r in reply[1])
+    return b"*%d\r\n" % len(reply) + b"".join(encode(r, resp3) for r in reply)
+
+
+def serve(store, port=0):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            resp3 = False  # switched on by HELLO 3
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                if not line.startswith(b"*"):
+                    args = line.split()  # inline command
+                else:
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                if args:
+                    reply = store.execute(args)
+                    resp3 = resp3 or isinstance(reply, tuple)
+                    self.wfile.write(encode(reply, resp3))
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{server.server_address[1]}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server, url = serve(FakeRedis(), args.port)
+    print(f"Fake Redis on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Local mock of the OpenAI API (chat completions, streamed or not, and
+embeddings) with a fixed per-call latency and per-token delay, for measuring
+how many LLM round trips a /chat message costs, how long routing takes and
+the time to first token of streamed answers. Point the app at it with
+OPENAI_BASE_URL.
+
+    python benchmarks/mock_llm.py --latency-ms 400            # compare routing paths
+    python benchmarks/mock_llm.py --mode streaming            # time to first token vs full answer
+    python benchmarks/mock_llm.py --serve --port 8099         # just run the server
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 python app.py
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HR_WORDS = ("leave", "holiday", "payroll", "benefit", "pension", "sick", "maternity", "expenses", "notice period")
+FILE_WORDS = ("file", "document", "report", "sheet", "policy", "send", "find")
+FILLER = {"file", "document", "report", "find", "send", "me", "the", "a", "please", "show"}
+
+MESSAGES = [
+    "find the q3 sales report",
+    "how many days of annual leave do I get?",
+    "send me the maternity policy document",
+    "what is the capital of France?",
+    "hello there",
+    "how do I claim travel expenses?",
+]
+
+
+class MockLLM:
+    def __init__(self, latency_ms=300, dim=1536, token_ms=20, answer_words=200):
+        self.latency = latency_ms / 1000
+        self.token_delay = token_ms / 1000
+        self.answer_words = answer_words
+        self.dim = dim
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def chat(self, body):
+        """Return (kind, content) for a chat completion request."""
+        system = next((m["content"] for m in body.get("messages", []) if m["role"] == "system"), "")
+        # The legacy intent prompt embeds the message in the system prompt
+        user = next((m["content"] for m in reversed(body.get("messages", [])) if m["role"] == "user"), system.split("User input:\n")[-1])
+        text = user.lower()
+        is_hr = any(w in text for w in HR_WORDS) and not any(w in text for w in ("file", "document", "report"))
+        is_file = any(w in text for w in FILE_WORDS)
+        keywords = " ".join(w for w in text.rstrip("?").split() if w not in FILLER)
+
+        if "router for a document assistant" in system:
+            return "route", json.dumps({
+                "intent": "file_search" if is_file else "general_response",
+                "data": keywords if is_file else "",
+                "hr": is_hr,
+            })
+        if system.startswith("Classify the user query"):
+            return "classify", "HR_Admin" if is_hr else ("File_Operation" if is_file else "General")
+        if "strictly in JSON" in system:
+            return "detect", json.dumps({"intent": "file_search" if is_file else "general_response", "data": keywords if is_file else ""})
+        return "answer", f"Mock answer to: {user[:200]}. " + " ".join(f"word{i}" for i in range(self.answer_words))
+
+    def embedding(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [((digest[i % 32] + i) % 255) / 255 - 0.5 for i in range(self.dim)]
+
+
+def serve(llm, port=0):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, body, content):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, word in enumerate(content.split(" ")):
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(llm.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(llm.latency)
+            if self.path.endswith("/chat/completions") and body.get("stream"):
+                kind, content = llm.chat(body)
+                llm._count(f"{kind}_streamed")
+                self._stream(body, content)
+            elif self.path.endswith("/chat/completions"):
+                kind, content = llm.chat(body)
+                llm._count(kind)
+                if kind == "answer":
+                    time.sleep(llm.token_delay * len(content.split()))
+                self._reply(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+            elif self.path.endswith("/embeddings"):
+                llm._count("embeddings")
+                inputs = body.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self._reply(200, {
+                    "object": "list",
+                    "model": body.get("model", "mock"),
+                    "data": [{"object": "embedding", "index": i, "embedding": llm.embedding(str(t))} for i, t in enumerate(inputs)],
+                    "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in inputs), "total_tokens": sum(len(str(t)) // 4 for t in inputs)},
+                })
+            else:
+                self._reply(404, {"error": {"message": "not found"}})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20, help="delay per answer word")
+    parser.add_argument("--mode", choices=("routing", "streaming"), default="routing")
+    parser.add_argument("--serve", action="store_true", help="run the server until interrupted")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    llm = MockLLM(args.latency_ms, token_ms=args.token_ms)
+    server, base_url = serve(llm, args.port)
+    if args.serve:
+        print(f"Mock OpenAI API on {base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "sk-mock"
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    from openai_api import route_message, detect_intent_and_extract, answer_general_query, stream_general_query
+    from hr_router import classify_intent
+
+    print(f"Mock LLM latency {args.latency_ms} ms per call, {args.token_ms} ms per answer word\n")
+    if args.mode == "streaming":
+        question = "explain machine learning in simple terms"
+        started = time.perf_counter()
+        answer_general_query(question)
+        print(f"{'blocking answer':18} first byte {(time.perf_counter() - started) * 1000:7.0f} ms")
+        started = time.perf_counter()
+        first = None
+        for _ in stream_general_query(question):
+            first = first or time.perf_counter()
+        print(f"{'streamed answer':18} first token {(first - started) * 1000:6.0f} ms, "
+              f"complete {(time.perf_counter() - started) * 1000:7.0f} ms")
+        server.shutdown()
+        return
+
+    for label, route in (
+        ("two serial calls", lambda m: (detect_intent_and_extract(m), classify_intent(m))),
+        ("one routing call", route_message),
+    ):
+        llm.calls.clear()
+        started = time.perf_counter()
+        for message in MESSAGES:
+            route(message)
+        per_message_ms = (time.perf_counter() - started) * 1000 / len(MESSAGES)
+        calls = sum(llm.calls.values())
+        print(f"{label:18} {per_message_ms:7.0f} ms/message  {calls / len(MESSAGES):.1f} LLM calls/message  {dict(llm.calls)}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+CATALOG_DB = os.getenv("DRIVE_CATALOG_DB", "drive_catalog.db")
+CATALOG_TTL_SECONDS = int(os.getenv("DRIVE_CATALOG_TTL_SECONDS", str(12 * 3600)))
+# How long a query may wait for the very first catalog load of a user (0 = never wait)
+CATALOG_COLD_WAIT_SECONDS = float(os.getenv("DRIVE_CATALOG_COLD_WAIT_SECONDS", "5"))
+
+_stats = {
+    "hits": 0,
+    "stale_hits": 0,
+    "misses": 0,
+    "warming": 0,
+    "refreshes": 0,
+    "refresh_failures": 0,
+    "last_refresh_seconds": None,
+    "last_lookup_ms": None,
+}
+_stats_lock = threading.Lock()
+_refreshing = {}  # catalog_id -> threading.Event set when the refresh finishes
+_refreshing_lock = threading.Lock()
+
+
+def init_catalog():
+    conn = sqlite3.connect(CATALOG_DB)
+    c = conn.cursor()
+    # Catalogs used to be shared per tenant; they are only a cache, so drop them
+    c.execute('PRAGMA table_info(catalog_state)')
+    if "tenant_id" in [row[1] for row in c.fetchall()]:
+        c.execute('DROP TABLE catalog_drives')
+        c.execute('DROP TABLE catalog_state')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_drives (
+            catalog_id TEXT NOT NULL,
+            drive_id TEXT NOT NULL,
+            site_id TEXT NOT NULL,
+            site_name TEXT,
+            drive_name TEXT,
+            PRIMARY KEY (catalog_id, drive_id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_state (
+            catalog_id TEXT PRIMARY KEY,
+            refreshed_at REAL NOT NULL,
+            site_count INTEGER,
+            drive_count INTEGER,
+            refresh_seconds REAL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def _claims(token):
+    """Claims of an access token, read without validating it."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return {}
+
+
+def tenant_from_token(token):
+    """The tenant id (tid claim) of an access token."""
+    return _claims(token).get("tid") or "default"
+
+
+def catalog_id_from_token(token):
+    """
+    Catalog of a delegated token: "<tid>:<oid>". Discovery runs with the user's
+    token and only finds the drives that user can see, so catalogs are per user.
+    """
+    claims = _claims(token)
+    return f"{claims.get('tid') or 'default'}:{claims.get('oid') or 'default'}"
+
+
+def _bump(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _load(catalog_id):
+    conn = sqlite3.connect(CATALOG_DB)
+    c = conn.cursor()
+    c.execute('SELECT refreshed_at FROM catalog_state WHERE catalog_id = ?', (catalog_id,))
+    row = c.fetchone()
+    if not row:
+        conn.close()
+        return None, []
+    c.execute('''
+        SELECT site_id, drive_id, site_name, drive_name FROM catalog_drives
+        WHERE catalog_id = ?
+    ''', (catalog_id,))
+    drives = [
+        {"site_id": r[0], "drive_id": r[1], "site_name": r[2], "drive_name": r[3]}
+        for r in c.fetchall()
+    ]
+    conn.close()
+    return row[0], drives
+
+
+def _store(catalog_id, drives, refresh_seconds):
+    conn = sqlite3.connect(CATALOG_DB)
+    c = conn.cursor()
+    c.execute('DELETE FROM catalog_drives WHERE catalog_id = ?', (catalog_id,))
+    c.executemany('''
+        INSERT OR REPLACE INTO catalog_drives (catalog_id, drive_id, site_id, site_name, drive_name)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(catalog_id, d["drive_id"], d["site_id"], d.get("site_name"), d.get("drive_name")) for d in drives])
+    c.execute('''
+        INSERT OR REPLACE INTO catalog_state (catalog_id, refreshed_at, site_count, drive_count, refresh_seconds)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (catalog_id, time.time(), len({d["site_id"] for d in drives}), len(drives), refresh_seconds))
+    conn.commit()
+    conn.close()
+
+
+def refresh_catalog(token, loader, catalog_id=None):
+    """Run the (slow) site/drive discovery and replace the catalog (by default the token user's)."""
+    catalog_id = catalog_id or catalog_id_from_token(token)
+    started = time.time()
+    try:
+        drives = loader(token)
+        elapsed = time.time() - started
+        if not drives:
+            logging.warning(f"⚠️ Drive catalog refresh for {catalog_id} returned no drives. Keeping previous catalog.")
+            _bump("refresh_failures")
+            return
+        _store(catalog_id, drives, elapsed)
+        _bump("refreshes")
+        with _stats_lock:
+            _stats["last_refresh_seconds"] = round(elapsed, 3)
+        logging.info(f"📚 Drive catalog for {catalog_id} refreshed: {len(drives)} drives in {elapsed:.1f}s")
+    except Exception as e:
+        _bump("refresh_failures")
+        logging.error(f"❌ Drive catalog refresh failed for {catalog_id}: {e}")
+
+
+def refresh_in_background(token, loader, catalog_id):
+    """Start a refresh unless one is already running for the catalog. Returns its done-event."""
+    with _refreshing_lock:
+        if catalog_id in _refreshing:
+            return _refreshing[catalog_id]
+        done = threading.Event()
+        _refreshing[catalog_id] = done
+
+    def run():
+        try:
+            refresh_catalog(token, loader, catalog_id)
+        finally:
+            with _refreshing_lock:
+                _refreshing.pop(catalog_id, None)
+            done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done
+
+
+def get_drives(token, loader, catalog_id=None):
+    """
+    Return the cached drives of the token's user (or the catalog stored under
+    catalog_id) without waiting on discovery. Stale or missing catalogs are
+    refreshed in the background with `loader`.
+    """
+    started = time.perf_counter()
+    catalog_id = catalog_id or catalog_id_from_token(token)
+    refreshed_at, drives = _load(catalog_id)
+
+    if refreshed_at is None:
+        _bump("misses")
+        done = refresh_in_background(token, loader, catalog_id)
+        if CATALOG_COLD_WAIT_SECONDS > 0 and done.wait(CATALOG_COLD_WAIT_SECONDS):
+            refreshed_at, drives = _load(catalog_id)
+        if refreshed_at is None:
+            _bump("warming")
+            logging.warning(f"⏳ Drive catalog for {catalog_id} is still warming up. SharePoint sites are skipped for this query.")
+    elif time.time() - refreshed_at > CATALOG_TTL_SECONDS:
+        _bump("stale_hits")
+        refresh_in_background(token, loader, catalog_id)
+    else:
+        _bump("hits")
+
+    with _stats_lock:
+        _stats["last_lookup_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return drives
+
+
+def catalog_stats():
+    conn = sqlite3.connect(CATALOG_DB)
+    c = conn.cursor()
+    c.execute('SELECT catalog_id, refreshed_at, site_count, drive_count, refresh_seconds FROM catalog_state')
+    now = time.time()
+    catalogs = {
+        row[0]: {
+            "age_seconds": round(now - row[1], 1),
+            "sites": row[2],
+            "drives": row[3],
+            "refresh_seconds": row[4],
+        }
+        for row in c.fetchall()
+    }
+    conn.close()
+
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else None
+    with _refreshing_lock:
+        refreshing = list(_refreshing)
+    stats["refreshing"] = sorted(refreshing)
+    stats["ttl_seconds"] = CATALOG_TTL_SECONDS
+    stats["catalogs"] = catalogs
+    return stats
+
+
+init_catalog()
@@ -0,0 +1,195 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+# Provider limits: at most 2048 inputs and ~300k tokens per embeddings request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "250000"))
+
+_stats = {"hits": 0, "misses": 0, "api_calls": 0, "api_tokens": 0, "tokens_saved": 0}
+_stats_lock = threading.Lock()
+_maps = {}  # model -> read-only np.memmap over the vector file
+_maps_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+    return sqlite3.connect(os.path.join(EMBEDDING_CACHE_DIR, "index.db"), timeout=30)
+
+
+def init_embedding_cache():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            tokens INTEGER NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_models (
+            model TEXT PRIMARY KEY,
+            dim INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _vector_path(model):
+    return os.path.join(EMBEDDING_CACHE_DIR, f"{model}.f32")
+
+
+def _bump(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _read_rows(model, dim, rows):
+    """Read vectors through a memory map, remapping when the file has grown."""
+    needed = max(rows) + 1
+    with _maps_lock:
+        vectors = _maps.get(model)
+        if vectors is None or vectors.shape[0] < needed:
+            rows_on_disk = os.path.getsize(_vector_path(model)) // (dim * 4)
+            vectors = np.memmap(_vector_path(model), dtype="float32", mode="r", shape=(rows_on_disk, dim))
+            _maps[model] = vectors
+    return [np.array(vectors[r]) for r in rows]
+
+
+def _lookup(model, hashes):
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT dim FROM embedding_models WHERE model = ?', (model,))
+    row = c.fetchone()
+    if not row:
+        conn.close()
+        return None, {}
+    found = {}
+    unique = list(set(hashes))
+    for i in range(0, len(unique), 500):
+        chunk = unique[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        c.execute(f'''
+            SELECT text_hash, row, tokens FROM embeddings
+            WHERE model = ? AND text_hash IN ({placeholders})
+        ''', [model] + chunk)
+        found.update({h: (r, t) for h, r, t in c.fetchall()})
+    conn.close()
+    return row[0], found
+
+
+def _store(model, entries):
+    """entries: list of (text_hash, vector, tokens). Appends vectors and records their rows."""
+    matrix = np.asarray([e[1] for e in entries], dtype="float32")
+    dim = matrix.shape[1]
+    conn = _connect()
+    c = conn.cursor()
+    # The write lock serialises row allocation and file appends across processes
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('INSERT OR IGNORE INTO embedding_models (model, dim) VALUES (?, ?)', (model, dim))
+    c.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE model = ?', (model,))
+    start = c.fetchone()[0]
+
+    fd = os.open(_vector_path(model), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.pwrite(fd, matrix.tobytes(), start * dim * 4)
+    finally:
+        os.close(fd)
+
+    c.executemany('''
+        INSERT OR IGNORE INTO embeddings (model, text_hash, row, tokens)
+        VALUES (?, ?, ?, ?)
+    ''', [(model, h, start + i, tokens) for i, (h, _, tokens) in enumerate(entries)])
+    conn.commit()
+    conn.close()
+
+
+def _batches(texts):
+    """Split texts to respect both the input-count and (estimated) token limits."""
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = max(1, len(text) // 4)
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_BATCH_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def cached_embeddings(texts, model, provider):
+    """
+    Embeddings for texts, served from the on-disk cache where possible.
+    provider(texts) -> (vectors, total_tokens) is called only for misses,
+    deduplicated and split into provider-sized batches.
+    """
+    if not texts:
+        return []
+    hashes = [text_hash(t) for t in texts]
+    dim, found = _lookup(model, hashes)
+
+    results = {}
+    if found:
+        unique_hits = list(found)
+        for h, vector in zip(unique_hits, _read_rows(model, dim, [found[h][0] for h in unique_hits])):
+            results[h] = vector
+
+    hits = sum(1 for h in hashes if h in found)
+    _bump("hits", hits)
+    _bump("tokens_saved", sum(found[h][1] for h in hashes if h in found))
+
+    misses = {}
+    for h, t in zip(hashes, texts):
+        if h not in found:
+            misses.setdefault(h, t)
+    _bump("misses", len(hashes) - hits)
+
+    miss_hashes = list(misses)
+    miss_texts = [misses[h] for h in miss_hashes]
+    offset = 0
+    for batch in _batches(miss_texts):
+        vectors, total_tokens = provider(batch)
+        _bump("api_calls")
+        _bump("api_tokens", total_tokens)
+
+        batch_hashes = miss_hashes[offset:offset + len(batch)]
+        offset += len(batch)
+        total_chars = sum(len(t) for t in batch) or 1
+        entries = [
+            (h, v, max(1, round(total_tokens * len(t) / total_chars)))
+            for h, v, t in zip(batch_hashes, vectors, batch)
+        ]
+        _store(model, entries)
+        for h, v, _ in entries:
+            results[h] = np.asarray(v, dtype="float32")
+
+    return [results[h] for h in hashes]
+
+
+def embedding_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT model, COUNT(*) FROM embeddings GROUP BY model')
+    stats["entries"] = dict(c.fetchall())
+    conn.close()
+    return stats
+
+
+init_embedding_cache()
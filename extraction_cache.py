@@ -0,0 +1,176 @@
+import os
+import time
+import sqlite3
+import threading
+
+CACHE_DB = os.getenv("EXTRACTION_CACHE_DB", "extraction_cache.db")
+CACHE_MAX_BYTES = int(float(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# A file whose extraction failed is retried after this cooldown, doubling per failure up to the max, or once it changes
+EXTRACTION_RETRY_SECONDS = float(os.getenv("EXTRACTION_RETRY_SECONDS", "900"))
+EXTRACTION_RETRY_MAX_SECONDS = float(os.getenv("EXTRACTION_RETRY_MAX_SECONDS", str(24 * 3600)))
+
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0, "failures": 0, "skipped_failed": 0}
+_stats_lock = threading.Lock()
+
+
+def _connect():
+    return sqlite3.connect(CACHE_DB, timeout=30)
+
+
+def init_cache():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS extracted_text (
+            item_id TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            text TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            last_access REAL NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_extracted_text_access ON extracted_text (last_access)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_failures (
+            item_id TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            failures INTEGER NOT NULL,
+            retry_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def file_version(file):
+    """
+    Version tag for a drive item. cTag only changes with content, eTag with
+    content or metadata; fall back to modified time + size if neither is present.
+    """
+    return (
+        file.get("cTag")
+        or file.get("eTag")
+        or f"{file.get('lastModifiedDateTime', '')}:{file.get('size', '')}"
+    )
+
+
+def _bump(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def get_cached_text(item_id, version):
+    """Return cached text for this exact item version, or None. Stale versions are dropped."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT version, text FROM extracted_text WHERE item_id = ?', (item_id,))
+    row = c.fetchone()
+    if not row:
+        conn.close()
+        _bump("misses")
+        return None
+    if row[0] != version:
+        c.execute('DELETE FROM extracted_text WHERE item_id = ?', (item_id,))
+        conn.commit()
+        conn.close()
+        _bump("invalidations")
+        _bump("misses")
+        return None
+    c.execute('UPDATE extracted_text SET last_access = ? WHERE item_id = ?', (time.time(), item_id))
+    conn.commit()
+    conn.close()
+    _bump("hits")
+    return row[1]
+
+
+def put_cached_text(item_id, version, text):
+    size = len(text.encode("utf-8"))
+    if size > CACHE_MAX_BYTES:
+        return
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('''
+        INSERT OR REPLACE INTO extracted_text (item_id, version, text, size_bytes, last_access)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (item_id, version, text, size, time.time()))
+    _evict(c)
+    conn.commit()
+    conn.close()
+
+
+def record_failure(item_id, version):
+    """Remember a failed extraction of this item version; it is skipped until its retry time."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT version, failures FROM extraction_failures WHERE item_id = ?', (item_id,))
+    row = c.fetchone()
+    failures = row[1] + 1 if row and row[0] == version else 1
+    cooldown = min(EXTRACTION_RETRY_MAX_SECONDS, EXTRACTION_RETRY_SECONDS * 2 ** (failures - 1))
+    c.execute('''
+        INSERT OR REPLACE INTO extraction_failures (item_id, version, failures, retry_at)
+        VALUES (?, ?, ?, ?)
+    ''', (item_id, version, failures, time.time() + cooldown))
+    conn.commit()
+    conn.close()
+    _bump("failures")
+
+
+def failed_recently(item_id, version=None):
+    """True while a failed extraction of the item (of this version, if given) is cooling down."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT version, retry_at FROM extraction_failures WHERE item_id = ?', (item_id,))
+    row = c.fetchone()
+    conn.close()
+    if not row or (version is not None and row[0] != version) or row[1] <= time.time():
+        return False
+    _bump("skipped_failed")
+    return True
+
+
+def clear_failure(item_id):
+    conn = _connect()
+    conn.execute('DELETE FROM extraction_failures WHERE item_id = ?', (item_id,))
+    conn.commit()
+    conn.close()
+
+
+def _evict(c):
+    """Drop least recently used entries until the cache fits in CACHE_MAX_BYTES."""
+    c.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM extracted_text')
+    total = c.fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+    c.execute('SELECT item_id, size_bytes FROM extracted_text ORDER BY last_access ASC')
+    victims = []
+    for item_id, size in c.fetchall():
+        if total <= CACHE_MAX_BYTES:
+            break
+        victims.append((item_id,))
+        total -= size
+    c.executemany('DELETE FROM extracted_text WHERE item_id = ?', victims)
+    _bump("evictions", len(victims))
+
+
+def cache_stats():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM extracted_text')
+    entries, total = c.fetchone()
+    c.execute('SELECT COUNT(*) FROM extraction_failures WHERE retry_at > ?', (time.time(),))
+    cooling_down = c.fetchone()[0]
+    conn.close()
+
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+    stats["entries"] = entries
+    stats["size_bytes"] = total
+    stats["max_bytes"] = CACHE_MAX_BYTES
+    stats["failed_cooling_down"] = cooling_down
+    return stats
+
+
+init_cache()
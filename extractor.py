@@ -1,60 +1,245 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import multiprocessing
 import pytesseract
 import numpy as np
 import fitz  # PyMuPDF
 from PIL import Image
-from io import BytesIO
-import requests
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import http_client
 
 print(pytesseract.get_tesseract_version())
 
-# OCR for images using Tesseract
-def extract_text_from_image(image_url):
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_PAGES_PER_TASK = int(os.getenv("OCR_PAGES_PER_TASK", "4"))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "100"))
+OCR_FILE_TIMEOUT_SECONDS = float(os.getenv("OCR_FILE_TIMEOUT_SECONDS", "120"))
+# Files over this size are not downloaded; PDFs past PDF_MAX_PAGES are read only up to it
+EXTRACTION_MAX_MB = int(os.getenv("EXTRACTION_MAX_MB", "200"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+EXTRACTION_TMP_DIR = os.getenv("EXTRACTION_TMP_DIR") or None
+# Scanned pages are rendered straight to grayscale at this resolution (144 = the old 2x upscale)
+OCR_DPI = int(os.getenv("OCR_DPI", "144"))
+# A page whose text layer has fewer characters than this is treated as scanned
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "20"))
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+_stats = {
+    "files": 0, "bytes_downloaded": 0, "pages_text": 0, "pages_ocr": 0, "pages_skipped": 0,
+    "text_ms": 0.0, "render_ms": 0.0, "ocr_ms": 0.0, "render_bytes": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """Process-wide OCR worker pool, created on first use."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _ocr_pool
+
+
+def _reset_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+def _ocr_image_file(path):
+    """OCR worker: one image file."""
+    img = Image.open(path).convert("L")  # grayscale
+    img = img.resize((img.width * 2, img.height * 2))  # upscale for better OCR
+    return pytesseract.image_to_string(img)
+
+
+def _ocr_pdf_pages(path, page_numbers, dpi=OCR_DPI):
+    """
+    OCR worker: render a run of pages of one PDF file directly to grayscale at
+    dpi and OCR them. Returns (text, {"render_ms", "ocr_ms", "render_bytes"}) per page.
+    """
+    results = []
+    with fitz.open(path) as pdf_file:
+        for page_num in page_numbers:
+            started = time.perf_counter()
+            pix = pdf_file.load_page(page_num).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+            img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+            rendered = time.perf_counter()
+            text = pytesseract.image_to_string(img) + "\n"
+            results.append((text, {
+                "render_ms": round((rendered - started) * 1000, 1),
+                "ocr_ms": round((time.perf_counter() - rendered) * 1000, 1),
+                "render_bytes": len(pix.samples),
+            }))
+    return results
+
+
+def run_ocr_tasks(fn, tasks, cancel_event=None, timeout=OCR_FILE_TIMEOUT_SECONDS):
+    """
+    Run OCR tasks on the worker pool. Returns (results in task order, incomplete):
+    tasks that failed or did not finish before the timeout or cancellation come
+    back as None and set incomplete. With OCR_WORKERS <= 1 the tasks run serially
+    in the calling thread.
+    """
+    deadline = time.monotonic() + timeout
+    results = [None] * len(tasks)
+
+    if OCR_WORKERS <= 1:
+        for i, args in enumerate(tasks):
+            if (cancel_event and cancel_event.is_set()) or time.monotonic() >= deadline:
+                return results, True
+            results[i] = fn(*args)
+        return results, False
+
     try:
-        response = requests.get(image_url)
-        img = Image.open(BytesIO(response.content)).convert("L")  # grayscale
-        img = img.resize((img.width * 2, img.height * 2))  # upscale for better OCR
-        text = pytesseract.image_to_string(img)
-        return text.strip()
-    except Exception as e:
-        print(f"❌ Tesseract OCR failed: {e}")
-        return ""
+        futures = {get_ocr_pool().submit(fn, *args): i for i, args in enumerate(tasks)}
+    except BrokenProcessPool:
+        _reset_ocr_pool()
+        futures = {get_ocr_pool().submit(fn, *args): i for i, args in enumerate(tasks)}
+
+    pending = set(futures)
+    failed = False
+    while pending:
+        if cancel_event and cancel_event.is_set():
+            print("⚠️ OCR cancelled.")
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"⚠️ OCR timed out after {timeout}s.")
+            break
+        done, pending = wait(pending, timeout=min(remaining, 0.25), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except BrokenProcessPool:
+                _reset_ocr_pool()
+                return results, True
+            except Exception as e:
+                print(f"❌ OCR task failed: {e}")
+                failed = True
 
-# Extract text from scanned PDFs using Tesseract OCR
-def extract_text_from_scanned_pdf(pdf_url):
+    for future in pending:
+        future.cancel()
+    return results, failed or bool(pending)
+
+
+def extract_text(url, kind="pdf", cancel_event=None, size=None, deadline=None):
+    """
+    Text of the PDF (kind="pdf") or image (kind="image") at url, as (text, incomplete).
+    The file is downloaded once, streamed to a temp file; PyMuPDF reads the text
+    layer from that file, and the pages without one are OCR'd from the same file.
+    OCR workers receive the path, not the bytes. The download stops once
+    cancel_event is set or the monotonic deadline passes. incomplete is set when the
+    download or OCR failed, timed out or was cancelled: the text may be partial
+    and must not be cached.
+    """
+    max_bytes = EXTRACTION_MAX_MB * 1024 * 1024
+    if size and size > max_bytes:
+        print(f"⚠️ Skipping {size} byte file over the {EXTRACTION_MAX_MB} MB limit: {url}")
+        return "", False
+
+    with tempfile.NamedTemporaryFile(dir=EXTRACTION_TMP_DIR, suffix=f".{kind}", delete=False) as tmp:
+        path = tmp.name
+        written = http_client.download(url, tmp, max_bytes=max_bytes, deadline=deadline, cancel_event=cancel_event)
     try:
-        response = requests.get(pdf_url)
-        if response.status_code != 200 or "pdf" not in response.headers.get("Content-Type", "").lower():
-            print(f"⚠️ Invalid scanned PDF response: {pdf_url}")
-            return ""
-
-        pdf_file = fitz.open(stream=response.content, filetype="pdf")
-        text = ""
-        for page_num in range(pdf_file.page_count):
-            page = pdf_file.load_page(page_num)
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples).convert("L")
-            img = img.resize((img.width * 2, img.height * 2))
-            text += pytesseract.image_to_string(img) + "\n"
-        return text.strip()
+        if not written:
+            print(f"⚠️ Download failed or empty: {url}")
+            return "", True
+        if kind == "image":
+            results, incomplete = run_ocr_tasks(_ocr_image_file, [(path,)], cancel_event)
+            return (results[0] or "").strip(), incomplete
+        return _extract_pdf_file(path, url, cancel_event)
     except Exception as e:
-        print(f"❌ Tesseract PDF OCR failed: {e}")
-        return ""
+        print(f"❌ Text extraction failed for {url}: {e}")
+        return "", True
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
-# Text extraction from PDFs (non-scanned)
-def extract_text_from_pdf(pdf_url):
-    try:
-        response = requests.get(pdf_url)
-        content_type = response.headers.get("Content-Type", "")
-        if response.status_code != 200 or "pdf" not in content_type.lower():
-            print(f"⚠️ Invalid PDF response from {pdf_url} — Content-Type: {content_type}")
-            return ""
-
-        pdf_file = fitz.open(stream=response.content, filetype="pdf")
-        text = ""
-        for page_num in range(pdf_file.page_count):
+
+def _extract_pdf_file(path, url, cancel_event=None):
+    """
+    Text of a PDF, page by page: the text layer where a page has one, OCR only
+    for pages without text that carry images (scans). Mixed PDFs get both.
+    Returns (text, incomplete) like extract_text.
+    """
+    page_stats = []
+    texts = []
+    ocr_pages = []
+    with fitz.open(path) as pdf_file:
+        page_count = pdf_file.page_count
+        read_pages = min(page_count, PDF_MAX_PAGES)
+        if read_pages < page_count:
+            print(f"⚠️ Text extraction limited to the first {read_pages} of {page_count} pages: {url}")
+        for page_num in range(read_pages):
+            started = time.perf_counter()
             page = pdf_file.load_page(page_num)
-            text += page.get_text()
-        return text.strip()
-    except Exception as e:
-        print(f"❌ PyMuPDF failed to open PDF: {e}")
-        return ""
+            text = page.get_text()
+            stats = {"page": page_num + 1, "text_ms": round((time.perf_counter() - started) * 1000, 1)}
+            if len(text.strip()) >= OCR_MIN_PAGE_CHARS or not page.get_images():
+                stats.update(source="text" if text.strip() else "empty", text_bytes=len(text.encode("utf-8")))
+            else:
+                stats["source"] = "ocr"
+                ocr_pages.append(page_num)
+            texts.append(text)
+            page_stats.append(stats)
+
+    if len(ocr_pages) > OCR_MAX_PAGES:
+        print(f"⚠️ OCR limited to the first {OCR_MAX_PAGES} of {len(ocr_pages)} scanned pages: {url}")
+        for page_num in ocr_pages[OCR_MAX_PAGES:]:
+            page_stats[page_num]["source"] = "skipped"
+        ocr_pages = ocr_pages[:OCR_MAX_PAGES]
+
+    # Scanned pages are OCR'd in parallel in runs of OCR_PAGES_PER_TASK and put back in page order
+    runs = [ocr_pages[i:i + OCR_PAGES_PER_TASK] for i in range(0, len(ocr_pages), OCR_PAGES_PER_TASK)]
+    results, incomplete = run_ocr_tasks(_ocr_pdf_pages, [(path, run) for run in runs], cancel_event)
+    for run, result in zip(runs, results):
+        for page_num, (text, stats) in zip(run, result or []):
+            texts[page_num] = text
+            page_stats[page_num].update(stats, text_bytes=len(text.encode("utf-8")))
+
+    _report(url, os.path.getsize(path), page_stats)
+    return "".join(texts).strip(), incomplete
+
+
+def _report(url, file_bytes, page_stats):
+    """Per-page timings and sizes go to the debug log; totals to the log line and extraction_stats()."""
+    for stats in page_stats:
+        logging.debug(f"📄 {url} page {stats['page']}: {stats}")
+    by_source = {}
+    for stats in page_stats:
+        by_source[stats["source"]] = by_source.get(stats["source"], 0) + 1
+    totals = {key: sum(p.get(key, 0) for p in page_stats) for key in ("text_ms", "render_ms", "ocr_ms", "render_bytes")}
+    with _stats_lock:
+        _stats["files"] += 1
+        _stats["bytes_downloaded"] += file_bytes
+        _stats["pages_text"] += by_source.get("text", 0) + by_source.get("empty", 0)
+        _stats["pages_ocr"] += sum(1 for p in page_stats if p["source"] == "ocr" and "ocr_ms" in p)
+        _stats["pages_skipped"] += by_source.get("skipped", 0) + sum(1 for p in page_stats if p["source"] == "ocr" and "ocr_ms" not in p)
+        for key, value in totals.items():
+            _stats[key] += value
+    logging.info(
+        f"📄 Extracted {url[:80]}: {file_bytes} bytes, pages {by_source}, "
+        f"text {totals['text_ms']:.0f} ms, render {totals['render_ms']:.0f} ms, OCR {totals['ocr_ms']:.0f} ms"
+    )
+
+
+def extraction_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_ocr_ms_per_page"] = round(stats["ocr_ms"] / stats["pages_ocr"], 1) if stats["pages_ocr"] else None
+    for key in ("text_ms", "render_ms", "ocr_ms"):
+        stats[key] = round(stats[key], 1)
+    return stats
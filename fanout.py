@@ -0,0 +1,73 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logging.basicConfig(level=logging.INFO)
+
+
+class FanOut:
+    """
+    Bounded-concurrency task runner with a global deadline.
+    Tasks may submit follow-up tasks; join() returns once everything is done
+    or the deadline passes, in which case unfinished work is dropped.
+    """
+
+    def __init__(self, max_workers=16, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.timed_out = False
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._closed or self.expired():
+                return None
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._futures.add(future)
+            return future
+
+    def join(self):
+        """Wait for all submitted (and follow-up) tasks. Returns False on deadline."""
+        while True:
+            with self._lock:
+                pending = {f for f in self._futures if not f.done()}
+            if not pending:
+                break
+            remaining = self.remaining()
+            if remaining == 0:
+                self.timed_out = True
+                break
+            wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        with self._lock:
+            done = [f for f in self._futures if f.done()]
+            self._futures -= set(done)
+        for f in done:
+            if not f.cancelled() and f.exception():
+                logging.error(f"Fan-out task failed: {f.exception()}")
+
+        if self.timed_out:
+            logging.warning("⏱️ Fan-out deadline reached. Returning partial results.")
+        return not self.timed_out
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,255 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import pickle
+import numpy as np
+import faiss
+from semantic_search import build_vector_index, apply_search_params, search_vectors, build_term_index
+
+logging.basicConfig(level=logging.INFO)
+
+FILE_INDEX_DB = os.getenv("FILE_INDEX_DB", "file_index.db")
+FILE_INDEX_DIR = os.getenv("FILE_INDEX_DIR", "file_index")
+FAISS_FILE = os.path.join(FILE_INDEX_DIR, "index.faiss")
+TERMS_FILE = os.path.join(FILE_INDEX_DIR, "terms.pkl")
+GENERATION_FILE = os.path.join(FILE_INDEX_DIR, "GENERATION")
+
+_resident = {"generation": None, "index": None, "terms": None}
+_resident_lock = threading.Lock()
+
+
+def _connect():
+    return sqlite3.connect(FILE_INDEX_DB, timeout=30)
+
+
+def init_file_index():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS indexed_files (
+            row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id TEXT UNIQUE NOT NULL,
+            drive_id TEXT NOT NULL,
+            site_id TEXT,
+            name TEXT,
+            version TEXT,
+            text TEXT,
+            vector BLOB,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS drive_cursors (
+            drive_id TEXT PRIMARY KEY,
+            delta_link TEXT,
+            crawled_at REAL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def get_delta_link(drive_id):
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT delta_link FROM drive_cursors WHERE drive_id = ?', (drive_id,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def save_delta_link(drive_id, delta_link):
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('''
+        INSERT OR REPLACE INTO drive_cursors (drive_id, delta_link, crawled_at)
+        VALUES (?, ?, ?)
+    ''', (drive_id, delta_link, time.time()))
+    conn.commit()
+    conn.close()
+
+
+def get_versions(item_ids):
+    """Return {item_id: version} for items already in the index."""
+    if not item_ids:
+        return {}
+    conn = _connect()
+    c = conn.cursor()
+    placeholders = ",".join("?" * len(item_ids))
+    c.execute(f'SELECT item_id, version FROM indexed_files WHERE item_id IN ({placeholders})', list(item_ids))
+    versions = dict(c.fetchall())
+    conn.close()
+    return versions
+
+
+def get_unversioned(drive_id):
+    """Ids of the drive's items stored without a version: their extraction has to be retried."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT item_id FROM indexed_files WHERE drive_id = ? AND version IS NULL', (drive_id,))
+    item_ids = [row[0] for row in c.fetchall()]
+    conn.close()
+    return item_ids
+
+
+def upsert_files(rows):
+    """rows: dicts with item_id, drive_id, site_id, name, version, text and vector. A None version is retried on the next crawl."""
+    conn = _connect()
+    c = conn.cursor()
+    now = time.time()
+    c.executemany('''
+        INSERT INTO indexed_files (item_id, drive_id, site_id, name, version, text, vector, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(item_id) DO UPDATE SET
+            drive_id = excluded.drive_id,
+            site_id = excluded.site_id,
+            name = excluded.name,
+            version = excluded.version,
+            text = excluded.text,
+            vector = excluded.vector,
+            updated_at = excluded.updated_at
+    ''', [
+        (
+            r["item_id"], r["drive_id"], r.get("site_id"), r.get("name"), r.get("version"), r.get("text"),
+            np.asarray(r["vector"], dtype="float32").tobytes(), now
+        )
+        for r in rows
+    ])
+    conn.commit()
+    conn.close()
+
+
+def delete_files(item_ids):
+    conn = _connect()
+    c = conn.cursor()
+    c.executemany('DELETE FROM indexed_files WHERE item_id = ?', [(i,) for i in item_ids])
+    conn.commit()
+    conn.close()
+
+
+def lookup(item_ids):
+    """Return {item_id: {"text", "vector", "version"}} for the given items."""
+    if not item_ids:
+        return {}
+    conn = _connect()
+    c = conn.cursor()
+    placeholders = ",".join("?" * len(item_ids))
+    c.execute(f'''
+        SELECT item_id, text, vector, version FROM indexed_files
+        WHERE item_id IN ({placeholders})
+    ''', list(item_ids))
+    found = {
+        row[0]: {"text": row[1], "vector": np.frombuffer(row[2], dtype="float32"), "version": row[3]}
+        for row in c.fetchall()
+    }
+    conn.close()
+    return found
+
+
+def build_file_index():
+    """Write a new FAISS generation and keyword term index from every vector and text in the store."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT row_id, vector, item_id, version, text FROM indexed_files WHERE vector IS NOT NULL')
+    rows = c.fetchall()
+    conn.close()
+    if not rows:
+        logging.warning("⚠️ File index is empty. Nothing to write.")
+        return None
+
+    ids = np.array([r[0] for r in rows], dtype="int64")
+    matrix = np.vstack([np.frombuffer(r[1], dtype="float32") for r in rows])
+    # Flat for small corpora, IVF/HNSW above FAISS_ANN_THRESHOLD (see semantic_search.make_index)
+    index = build_vector_index(matrix, ids=ids)
+    # Keywords of the stored texts, so ranking doesn't tokenise them per query
+    terms = build_term_index((r[2], r[3], r[4]) for r in rows if r[3] is not None and r[4])
+
+    # Write then rename so readers never see a half-written index
+    os.makedirs(FILE_INDEX_DIR, exist_ok=True)
+    generation = str(int(time.time() * 1000))
+    tmp_path = f"{FAISS_FILE}.{generation}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, FAISS_FILE)
+    with open(f"{TERMS_FILE}.{generation}.tmp", "wb") as f:
+        pickle.dump(terms, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{TERMS_FILE}.{generation}.tmp", TERMS_FILE)
+    with open(f"{GENERATION_FILE}.tmp", "w") as f:
+        f.write(generation)
+    os.replace(f"{GENERATION_FILE}.tmp", GENERATION_FILE)
+    logging.info(f"✅ File index generation {generation} written with {len(rows)} vectors")
+    return generation
+
+
+def _resident_index():
+    """The prebuilt FAISS index, kept in memory and reloaded when a new generation appears."""
+    try:
+        with open(GENERATION_FILE) as f:
+            generation = f.read().strip()
+    except OSError:
+        return None
+    with _resident_lock:
+        if _resident["generation"] != generation:
+            started = time.time()
+            _resident["index"] = apply_search_params(faiss.read_index(FAISS_FILE))
+            try:
+                with open(TERMS_FILE, "rb") as f:
+                    _resident["terms"] = pickle.load(f)
+            except OSError:
+                _resident["terms"] = None  # generation written before the term index existed
+            _resident["generation"] = generation
+            logging.info(f"📦 Loaded file index generation {generation} in {time.time() - started:.2f}s")
+        return _resident["index"]
+
+
+def term_index():
+    """Keyword term index of the resident generation (see semantic_search.build_term_index), or None."""
+    _resident_index()
+    return _resident["terms"]
+
+
+def search(query_vector, k=20):
+    """Nearest indexed files for a query vector: [{"item_id", "drive_id", "site_id", "distance"}]."""
+    index = _resident_index()
+    if index is None or index.ntotal == 0:
+        return []
+    distances, row_ids = search_vectors(index, [query_vector], min(k, index.ntotal))
+    hits = {int(r): float(d) for r, d in zip(row_ids[0], distances[0]) if r >= 0}
+    if not hits:
+        return []
+
+    conn = _connect()
+    c = conn.cursor()
+    placeholders = ",".join("?" * len(hits))
+    c.execute(f'''
+        SELECT row_id, item_id, drive_id, site_id FROM indexed_files
+        WHERE row_id IN ({placeholders})
+    ''', list(hits))
+    results = [
+        {"item_id": row[1], "drive_id": row[2], "site_id": row[3], "distance": hits[row[0]]}
+        for row in c.fetchall()
+    ]
+    conn.close()
+    return sorted(results, key=lambda r: r["distance"])
+
+
+def index_stats():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), MAX(updated_at) FROM indexed_files')
+    count, last_update = c.fetchone()
+    c.execute('SELECT COUNT(*), MIN(crawled_at) FROM drive_cursors')
+    drives, oldest_crawl = c.fetchone()
+    conn.close()
+    return {
+        "files": count,
+        "drives_crawled": drives,
+        "last_update_age_seconds": round(time.time() - last_update, 1) if last_update else None,
+        "oldest_crawl_age_seconds": round(time.time() - oldest_crawl, 1) if oldest_crawl else None,
+        "resident_generation": _resident["generation"],
+    }
+
+
+init_file_index()
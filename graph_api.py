@@ -1,14 +1,33 @@
-import requests
 import os
 import time
 import logging
 import re
-from semantic_search import rank_files_by_similarity, build_faiss_index
+import threading
+from fanout import FanOut
+import http_client
+from drive_catalog import get_drives
+from extraction_cache import get_cached_text, put_cached_text, file_version, record_failure, failed_recently, clear_failure
+import file_index
+from semantic_search import rank_files, embed_texts, prefilter_files, build_token_index
 from msal_auth import load_token_cache, save_token_cache, build_msal_app
-from extractor import extract_text_from_scanned_pdf, extract_text_from_pdf, extract_text_from_image
+from extractor import extract_text
 
 logging.basicConfig(level=logging.INFO)
 
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.microsoft.com/v1.0")
+GRAPH_MAX_WORKERS = int(os.getenv("GRAPH_MAX_WORKERS", "16"))
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "25"))
+GRAPH_BATCH_SIZE = 20  # Graph JSON $batch limit
+METADATA_DEADLINE_SECONDS = float(os.getenv("METADATA_DEADLINE_SECONDS", "10"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "8"))
+EXTRACTION_DEADLINE_SECONDS = float(os.getenv("EXTRACTION_DEADLINE_SECONDS", "60"))
+FILE_INDEX_NEIGHBOURS = int(os.getenv("FILE_INDEX_NEIGHBOURS", "20"))
+# Download/OCR files missing from the prebuilt index inside the request (slow; off by default)
+QUERY_TIME_EXTRACTION = os.getenv("QUERY_TIME_EXTRACTION", "false").lower() == "true"
+# Search hits that go on to text lookup/extraction, embedding and hybrid ranking after the
+# cheap name/path/metadata pass; the rest are listed after them unranked. 0 ranks every hit.
+SEARCH_RERANK_TOP_N = int(os.getenv("SEARCH_RERANK_TOP_N", "40"))
+
 def refresh_token(account_id):
     cache = load_token_cache(account_id)
     app = build_msal_app(cache)
@@ -20,55 +39,107 @@ def refresh_token(account_id):
             return result["access_token"]
     return None
 
-def retry_request(url, headers, method="get", json=None, max_retries=2, account_id=None):
-    for i in range(max_retries + 1):
-        try:
-            res = requests.request(method, url, headers=headers, json=json)
-            if res.status_code == 401 and account_id:
-                logging.warning("Received 401 Unauthorized. Attempting token refresh...")
-                token = refresh_token(account_id)
-                if token:
-                    headers["Authorization"] = f"Bearer {token}"
-                    continue
-            elif res.status_code == 429:
-                retry_after = int(res.headers.get("Retry-After", 5))
-                logging.warning(f"Rate limited on {url}. Retrying after {retry_after} seconds...")
-                time.sleep(retry_after)
-            else:
-                logging.info(f"Request to {url} returned status {res.status_code}")
-                return res
-        except Exception as e:
-            logging.error(f"Request error on {url}: {e}")
-    logging.error(f"Max retries exceeded for {url}")
+def retry_request(url, headers, method="get", json=None, max_retries=2, account_id=None, deadline=None, idempotent=None):
+    """
+    Graph request over the shared pooled client, retried with jittered backoff
+    on errors, 429 and 5xx (POSTs only on 429 and connect errors, unless
+    idempotent=True). A 401 refreshes the user's token once and retries.
+    """
+    res = http_client.request_with_retries(
+        method, url, max_retries=max_retries, deadline=deadline, idempotent=idempotent, headers=headers, json=json
+    )
+    if res is not None and res.status_code == 401 and account_id:
+        logging.warning("Received 401 Unauthorized. Attempting token refresh...")
+        token = refresh_token(account_id)
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+            res = http_client.request_with_retries(
+                method, url, max_retries=max_retries, deadline=deadline, idempotent=idempotent, headers=headers, json=json
+            )
+    if res is None:
+        logging.error(f"Max retries exceeded for {url}")
+    else:
+        logging.info(f"Request to {url} returned status {res.status_code}")
     return res
 
 def get_file_with_download_url(drive_id, item_id, token):
     headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{item_id}"
-    res = requests.get(url, headers=headers)
-    if res.status_code == 200:
+    url = f"{GRAPH_API_URL}/drives/{drive_id}/items/{item_id}"
+    res = retry_request(url, headers)
+    if res is not None and res.status_code == 200:
         return res.json()
     else:
         logging.warning(f"⚠️ Failed to fetch full metadata for item {item_id}")
         return None
 
+def get_files_with_download_urls(items, token, deadline=None, max_retries=2):
+    """
+    Fetch full metadata (including @microsoft.graph.downloadUrl) for up to
+    GRAPH_BATCH_SIZE items in one Graph $batch call. Returns {item_id: metadata}.
+    """
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    pending = {item["id"]: item for item in items[:GRAPH_BATCH_SIZE]}
+    results = {}
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        body = {"requests": [
+            {
+                "id": item_id,
+                "method": "GET",
+                "url": f"/drives/{item['parentReference']['driveId']}/items/{item_id}"
+            }
+            for item_id, item in pending.items()
+        ]}
+        # A $batch of GETs is safe to resend
+        res = retry_request(f"{GRAPH_API_URL}/$batch", headers, method="post", json=body, deadline=deadline, idempotent=True)
+        if res is None or res.status_code != 200:
+            logging.warning(f"⚠️ $batch metadata request failed for {len(pending)} items")
+            break
+
+        throttled, retry_after = False, None
+        for sub in res.json().get("responses", []):
+            item_id = sub.get("id")
+            status = sub.get("status")
+            if status == 200:
+                results[item_id] = sub.get("body", {})
+                pending.pop(item_id, None)
+            elif status in http_client.RETRY_STATUSES:
+                throttled = True
+                header = (sub.get("headers") or {}).get("Retry-After")
+                if header and header.isdigit():
+                    retry_after = max(retry_after or 0, int(header))
+            else:
+                logging.warning(f"⚠️ Failed to fetch full metadata for item {item_id}: {status}")
+                pending.pop(item_id, None)
+
+        if pending and throttled and attempt < max_retries:
+            delay = http_client.backoff_delay(attempt, retry_after)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                break
+            logging.warning(f"Throttled inside $batch. Retrying {len(pending)} items after {delay:.1f} seconds...")
+            time.sleep(delay)
+
+    return results
+
 def get_user_email(account_id):
     token = refresh_token(account_id)
     if not token:
         return None
     headers = {"Authorization": f"Bearer {token}"}
-    res = retry_request("https://graph.microsoft.com/v1.0/me", headers)
-    if res.status_code == 200:
+    res = retry_request(f"{GRAPH_API_URL}/me", headers)
+    if res is not None and res.status_code == 200:
         return res.json().get("mail") or res.json().get("userPrincipalName")
     return None
 
 def discover_all_sites(token):
     headers = {"Authorization": f"Bearer {token}"}
     sites = []
-    url = "https://graph.microsoft.com/v1.0/sites?search=*"
+    url = f"{GRAPH_API_URL}/sites?search=*"
     while url:
         res = retry_request(url, headers)
-        if res.status_code == 200:
+        if res is not None and res.status_code == 200:
             data = res.json()
             sites.extend(data.get("value", []))
             url = data.get("@odata.nextLink")
@@ -76,11 +147,88 @@ def discover_all_sites(token):
             break
     return sites
 
-def search_all_files(token, query):
+def discover_all_drives(token):
+    """Every document library of every site, as flat rows for the drive catalog."""
+    headers = {"Authorization": f"Bearer {token}"}
+    drives = []
+    lock = threading.Lock()
+
+    def list_drives(site):
+        url = f"{GRAPH_API_URL}/sites/{site['id']}/drives"
+        while url:
+            res = retry_request(url, dict(headers))
+            if res is None or res.status_code != 200:
+                break
+            data = res.json()
+            with lock:
+                drives.extend({
+                    "site_id": site["id"],
+                    "drive_id": drive["id"],
+                    "site_name": site.get("displayName") or site.get("name"),
+                    "drive_name": drive.get("name"),
+                } for drive in data.get("value", []))
+            url = data.get("@odata.nextLink")
+
+    with FanOut(max_workers=GRAPH_MAX_WORKERS) as fanout:
+        for site in discover_all_sites(token):
+            if site.get("id"):
+                fanout.submit(list_drives, site)
+        fanout.join()
+
+    return drives
+
+def find_graph_files(token, query_batch):
+    """Keyword search across the user's drive and all site drives, with full metadata."""
     headers = {"Authorization": f"Bearer {token}"}
     all_results = []
     seen_ids = set()
+    hits = []
+    lock = threading.Lock()
+
+    def collect(items, site_id=None):
+        with lock:
+            for item in items:
+                if item["id"] not in seen_ids:
+                    seen_ids.add(item["id"])
+                    hits.append((item, site_id))
+
+    def search_url(url, site_id=None):
+        res = retry_request(url, dict(headers), deadline=fanout.deadline)
+        if res is not None and res.status_code == 200:
+            collect(res.json().get("value", []), site_id)
 
+    def fetch_metadata(batch, deadline):
+        metas = get_files_with_download_urls([item for item, _ in batch], token, deadline=deadline)
+        with lock:
+            for item, site_id in batch:
+                meta = metas.get(item["id"])
+                if meta:
+                    all_results.append(tag_site_id([meta], site_id)[0] if site_id else meta)
+
+    with FanOut(max_workers=GRAPH_MAX_WORKERS, timeout=SEARCH_DEADLINE_SECONDS) as fanout:
+        for q in query_batch:
+            fanout.submit(search_url, f"{GRAPH_API_URL}/me/drive/root/search(q='{q}')")
+
+        # Sites/drives come from the cached catalog; discovery never runs on the query path
+        for drive in get_drives(token, discover_all_drives):
+            for q in query_batch:
+                fanout.submit(search_url, f"{GRAPH_API_URL}/drives/{drive['drive_id']}/search(q='{q}')", drive["site_id"])
+
+        fanout.join()
+        with lock:
+            collected = list(hits)
+
+    # Collapse per-hit metadata lookups into $batch calls of GRAPH_BATCH_SIZE.
+    # This phase gets its own budget so partial search results still resolve.
+    with FanOut(max_workers=GRAPH_MAX_WORKERS, timeout=METADATA_DEADLINE_SECONDS) as batches:
+        for i in range(0, len(collected), GRAPH_BATCH_SIZE):
+            batches.submit(fetch_metadata, collected[i:i + GRAPH_BATCH_SIZE], batches.deadline)
+        batches.join()
+
+    with lock:
+        return list(all_results)
+
+def search_all_files(token, query, cancel_event=None):
     year_match = re.search(r'\b(19|20)\d{2}\b', query)
     year = year_match.group() if year_match else None
 
@@ -91,74 +239,149 @@ def search_all_files(token, query):
     core = " ".join(words).strip().lower()
     query_batch = [core]
 
-    for q in query_batch:
-        me_url = f"https://graph.microsoft.com/v1.0/me/drive/root/search(q='{q}')"
-        me_res = retry_request(me_url, headers)
-        if me_res.status_code == 200:
-            for item in me_res.json().get("value", []):
-                if item["id"] not in seen_ids:
-                    seen_ids.add(item["id"])
-                    meta = get_file_with_download_url(item["parentReference"]["driveId"], item["id"], token)
-                    if meta:
-                        all_results.append(meta)
-
-    sites = discover_all_sites(token)
-    for site in sites:
-        site_id = site.get("id")
-        if not site_id:
-            continue
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        drives_res = retry_request(drives_url, headers)
-        if drives_res.status_code != 200:
-            continue
-        for drive in drives_res.json().get("value", []):
-            for q in query_batch:
-                search_url = f"https://graph.microsoft.com/v1.0/drives/{drive['id']}/search(q='{q}')"
-                search_res = retry_request(search_url, headers)
-                if search_res.status_code == 200:
-                    for item in search_res.json().get("value", []):
-                        if item["id"] not in seen_ids:
-                            seen_ids.add(item["id"])
-                            meta = get_file_with_download_url(item["parentReference"]["driveId"], item["id"], token)
-                            if meta:
-                                all_results.append(tag_site_id([meta], site_id)[0])
+    all_results = find_graph_files(token, query_batch)
 
     if not all_results:
         logging.info("No results from batch search. Using recent files.")
         all_results = fetch_recent_files(token)
 
     files = [f for f in all_results if "folder" not in f]
+    # Stage one: score hits on name, path and metadata; only the best are extracted and embedded
+    files, pruned = prefilter_files(query, files, SEARCH_RERANK_TOP_N)
+    if pruned:
+        logging.info(f"Ranking the top {len(files)} of {len(files) + len(pruned)} hits by content.")
+
+    # Semantic neighbours from the prebuilt index. They are re-fetched with the
+    # user's token, so only files the user can actually read are added.
+    # They already carry stored text and vectors, so stage one doesn't prune them:
+    # pruned hits that are also neighbours go back into stage two.
+    query_vector = embed_texts([query])[0]
+    neighbours = file_index.search(query_vector, k=FILE_INDEX_NEIGHBOURS)
+    neighbour_ids = {n["item_id"] for n in neighbours}
+    files += [f for f in pruned if f["id"] in neighbour_ids]
+    pruned = [f for f in pruned if f["id"] not in neighbour_ids]
+    known_ids = {f["id"] for f in files + pruned}
+    neighbours = [n for n in neighbours if n["item_id"] not in known_ids]
+    neighbour_metas = {}
+    metas_lock = threading.Lock()
 
-    def process_file(file):
-        download_url = file.get('@microsoft.graph.downloadUrl')
-        if not download_url:
-            logging.warning(f"⚠️ Skipping {file.get('name')}: no download URL.")
-            return ""
-        mime = file.get("file", {}).get("mimeType", "")
-        image_types = ["image/png", "image/jpeg", "image/jpg", "image/gif", "image/bmp"]
-        if mime in image_types:
-            return extract_text_from_image(download_url)
-        elif 'pdf' in mime:
-            text = extract_text_from_pdf(download_url)
-            return text if text.strip() else extract_text_from_scanned_pdf(download_url)
-        return ""
+    def fetch_neighbours(batch, deadline):
+        metas = get_files_with_download_urls(
+            [{"id": n["item_id"], "parentReference": {"driveId": n["drive_id"]}} for n in batch], token, deadline=deadline
+        )
+        with metas_lock:
+            neighbour_metas.update(metas)
 
+    with FanOut(max_workers=GRAPH_MAX_WORKERS, timeout=METADATA_DEADLINE_SECONDS) as batches:
+        for i in range(0, len(neighbours), GRAPH_BATCH_SIZE):
+            batches.submit(fetch_neighbours, neighbours[i:i + GRAPH_BATCH_SIZE], batches.deadline)
+        batches.join()
+        with metas_lock:
+            resolved = dict(neighbour_metas)
+    # Appended in index order, whichever batch finished first
+    for n in neighbours:
+        if n["item_id"] in resolved:
+            files.append(tag_site_id([resolved[n["item_id"]]], n["site_id"])[0])
+
+    # Text and vectors come from the ingestion pipeline; nothing is downloaded here
+    stored = file_index.lookup([f["id"] for f in files])
+    missing = []
+    indexed_versions = {}  # item id -> version of the stored text, for the prebuilt keyword index
     for file in files:
-        text = process_file(file)
-        if text:
-            file['extracted_text'] = text
+        entry = stored.get(file["id"])
+        # Entries without a version only hold a name vector: their extraction failed at ingest time
+        if entry and entry["version"] is not None:
+            if entry["text"]:
+                file['extracted_text'] = entry["text"]
+                indexed_versions[file["id"]] = entry["version"]
+            file['embedding'] = entry["vector"]
+        else:
+            missing.append(file)
+
+    if missing and QUERY_TIME_EXTRACTION:
+        texts, _ = extract_files(missing, cancel_event)
+        for file in missing:
+            if file["id"] in texts:
+                file['extracted_text'] = texts[file["id"]]
+    elif missing:
+        logging.info(f"{len(missing)} files are not ingested yet. Ranking them by name.")
+
+    # Stage two: per-request, in-memory FAISS ranking; nothing is written to disk or shared between workers
+    token_index = build_token_index(files, file_index.term_index(), indexed_versions)
+    return rank_files(query, files, top_k=None, token_index=token_index) + pruned
+
+def extract_file_text(file, cancel_event=None):
+    """
+    Text of a PDF/image drive item as (text, incomplete), served from the
+    extraction cache when possible. Incomplete (failed, timed out or cancelled)
+    extractions are returned but never cached.
+    """
+    mime = file.get("file", {}).get("mimeType", "")
+    image_types = ["image/png", "image/jpeg", "image/jpg", "image/gif", "image/bmp"]
+    if mime not in image_types and 'pdf' not in mime:
+        return "", False
+
+    # Cache hit: skip the download entirely
+    version = file_version(file)
+    cached = get_cached_text(file["id"], version)
+    if cached is not None:
+        return cached, False
+    # A broken file (corrupt, encrypted, over the size limit) isn't downloaded again until it changes or cools down
+    if failed_recently(file["id"], version):
+        return "", True
 
-    # Build FAISS index only for file searching
-    build_faiss_index(files, index_name="file")
+    download_url = file.get('@microsoft.graph.downloadUrl')
+    if not download_url:
+        logging.warning(f"⚠️ Skipping {file.get('name')}: no download URL.")
+        return "", True
+    # One download; the OCR fallback for scanned PDFs reuses the same file
+    kind = "image" if mime in image_types else "pdf"
+    text, incomplete = extract_text(download_url, kind, cancel_event, size=file.get("size"))
 
-    # Use FAISS for semantic ranking
-    ranked_files = rank_files_by_similarity(query, top_k=None, index_name="file")
-    return ranked_files
+    # Empty results are not cached: they are usually download/OCR failures
+    if text and not incomplete:
+        put_cached_text(file["id"], version, text)
+    if incomplete and not (cancel_event and cancel_event.is_set()):
+        # Failed on its own rather than cancelled by the caller's deadline
+        record_failure(file["id"], version)
+    elif not incomplete:
+        clear_failure(file["id"])
+    return text, incomplete
+
+def extract_files(files, cancel_event=None, timeout=EXTRACTION_DEADLINE_SECONDS):
+    """
+    Extract text for many files in parallel. Returns ({item_id: text}, incomplete
+    item ids): files whose extraction failed, timed out or never started.
+    """
+    cancel_event = cancel_event or threading.Event()
+    texts = {}
+    complete = set()
+    lock = threading.Lock()
+
+    def extract(file):
+        if cancel_event.is_set():
+            return
+        text, incomplete = extract_file_text(file, cancel_event)
+        with lock:
+            if text:
+                texts[file["id"]] = text
+            if not incomplete:
+                complete.add(file["id"])
+
+    # Files are downloaded in parallel threads; their OCR fans out further on the OCR process pool
+    with FanOut(max_workers=EXTRACTION_WORKERS, timeout=timeout) as extraction:
+        for file in files:
+            extraction.submit(extract, file)
+        if not extraction.join():
+            cancel_event.set()
+
+    with lock:
+        return dict(texts), {f["id"] for f in files} - complete
 
 def fetch_recent_files(token):
     headers = {"Authorization": f"Bearer {token}"}
-    res = retry_request("https://graph.microsoft.com/v1.0/me/drive/recent", headers)
-    if res.status_code == 200:
+    res = retry_request(f"{GRAPH_API_URL}/me/drive/recent", headers)
+    if res is not None and res.status_code == 200:
         return tag_site_id(res.json().get("value", []), "personal")
     return []
 
@@ -174,10 +397,10 @@ def check_file_access(token, item_id, user_email, site_id=None):
         return True
     headers = {"Authorization": f"Bearer {token}"}
     if site_id and site_id != "personal":
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{item_id}/permissions"
+        url = f"{GRAPH_API_URL}/sites/{site_id}/drive/items/{item_id}/permissions"
         try:
             res = retry_request(url, headers)
-            if res.status_code == 200:
+            if res is not None and res.status_code == 200:
                 return True
         except Exception as e:
             logging.warning(f"⚠️ SharePoint access check failed: {e}")
@@ -208,12 +431,16 @@ def send_email(token, to_email, subject, html_content):
     }
 
     try:
+        # Not idempotent: retried only on 429 and connect errors, never after the request may have been delivered
         res = retry_request(
-            "https://graph.microsoft.com/v1.0/me/sendMail",
+            f"{GRAPH_API_URL}/me/sendMail",
             headers,
             method="post",
             json=message
         )
+        if res is None:
+            logging.error(f"❌ Failed to send email to {to_email}: no response from Graph")
+            return False
         if res.status_code == 202:
             logging.info(f"✅ Email sent to {to_email}")
             return True
@@ -1,11 +1,26 @@
 import os
+import time
+import logging
+import threading
 from openai import OpenAI
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+from knowledge_base.build_index import get_embeddings
+from answer_cache import get_cached_answer, put_cached_answer
+from openai_api import stream_completion
 
 # Initialize OpenAI client
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+KB_INDEX_PATH = os.path.join(BASE_PATH, "knowledge_base", "faiss_index")
+KB_GENERATION_FILE = os.path.join(KB_INDEX_PATH, "GENERATION")
+
+# Resident knowledge base. Replaced as a whole on reload, so readers never see a half-swapped state.
+_kb_state = {"store": None, "generation": None, "loaded_at": None, "load_seconds": None}
+_kb_load_lock = threading.Lock()
+_kb_reloading = threading.Event()
+_kb_loads = 0
+
 def classify_intent(user_query):
     """Use ChatGPT to classify the user's intent."""
     response = client.chat.completions.create(
@@ -24,17 +39,97 @@ def classify_intent(user_query):
     )
     return response.choices[0].message.content.strip()
 
-def search_hr_knowledge_base(user_query):
-    """Search the FAISS index for HR/Admin-related answers."""
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    index_path = os.path.join(base_path, "knowledge_base", "faiss_index")
-    faiss_file = os.path.join(index_path, "index.faiss")
+_embeddings_instance = None
 
-    if not os.path.exists(faiss_file):
-        return "Knowledge base not found."
+def _embeddings():
+    global _embeddings_instance
+    if _embeddings_instance is None:
+        # Same provider as the builder (KB_EMBEDDINGS), so query and index vectors match
+        _embeddings_instance = get_embeddings()
+    return _embeddings_instance
+
+def kb_generation():
+    """Current on-disk index generation: the GENERATION file written by build_index, else the index mtime."""
+    try:
+        with open(KB_GENERATION_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    faiss_file = os.path.join(KB_INDEX_PATH, "index.faiss")
+    if os.path.exists(faiss_file):
+        return str(os.path.getmtime(faiss_file))
+    return None
+
+def _load_kb(generation):
+    """Load the index from disk and swap it in. Readers keep using the previous store meanwhile."""
+    global _kb_state, _kb_loads
+    with _kb_load_lock:
+        if _kb_state["generation"] == generation:
+            return
+        started = time.time()
+        store = FAISS.load_local(KB_INDEX_PATH, _embeddings(), allow_dangerous_deserialization=True)
+        if kb_generation() != generation and _kb_state["store"] is not None:
+            # A newer build landed while loading; keep serving the old store, the next query reloads
+            logging.info("HR knowledge base changed during load. Will reload.")
+            return
+        _kb_state = {
+            "store": store,
+            "generation": generation,
+            "loaded_at": time.time(),
+            "load_seconds": round(time.time() - started, 3),
+        }
+        _kb_loads += 1
+        logging.info(f"📚 HR knowledge base generation {generation} loaded in {_kb_state['load_seconds']}s")
+
+def _reload_in_background(generation):
+    if _kb_reloading.is_set():
+        return
+    _kb_reloading.set()
 
-    embeddings = OpenAIEmbeddings()
-    vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    def run():
+        try:
+            _load_kb(generation)
+        except Exception as e:
+            logging.error(f"❌ HR knowledge base reload failed: {e}")
+        finally:
+            _kb_reloading.clear()
+
+    threading.Thread(target=run, daemon=True).start()
+
+def get_kb_store():
+    """
+    Process-wide HR vector store, loaded lazily, as (store, generation of that
+    store). When build_index writes a new generation the old store keeps
+    serving until the new one is swapped in.
+    """
+    generation = kb_generation()
+    if generation is None:
+        return None, None
+    state = _kb_state
+    if state["store"] is None:
+        _load_kb(generation)
+        state = _kb_state
+    elif state["generation"] != generation:
+        _reload_in_background(generation)
+    return state["store"], state["generation"]
+
+def kb_stats():
+    state = _kb_state
+    return {
+        "generation": state["generation"],
+        "disk_generation": kb_generation(),
+        "loaded_at": state["loaded_at"],
+        "load_seconds": state["load_seconds"],
+        "loads": _kb_loads,
+        "reloading": _kb_reloading.is_set(),
+    }
+
+def search_hr_knowledge_base(user_query, vector_store=None):
+    """Search the FAISS index (the resident one unless vector_store is given) for HR/Admin-related answers."""
+    if vector_store is None:
+        vector_store, _ = get_kb_store()
+    if vector_store is None:
+        return "Knowledge base not found."
 
     results = vector_store.similarity_search(user_query, k=3)
     if not results:
@@ -43,11 +138,10 @@ def search_hr_knowledge_base(user_query):
     context = "\n\n".join([doc.page_content for doc in results])
     return context
 
-def generate_answer_from_context(user_query, context):
-    """Generate a helpful response using context and ChatGPT."""
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
+def _answer_request(user_query, context):
+    return {
+        "model": "gpt-4",
+        "messages": [
             {
                 "role": "system",
                 "content": "You are an HR assistant. Use the following context to answer the user's question."
@@ -57,18 +151,76 @@ def generate_answer_from_context(user_query, context):
                 "content": f"Context:\n{context}\n\nQuestion: {user_query}"
             }
         ],
-        temperature=0.2
-    )
+        "temperature": 0.2,
+    }
+
+def generate_answer_from_context(user_query, context):
+    """Generate a helpful response using context and ChatGPT."""
+    response = client.chat.completions.create(**_answer_request(user_query, context))
     return response.choices[0].message.content.strip()
 
-def handle_query(user_query):
-    """Route queries based on classified intent."""
-    intent = classify_intent(user_query)
+def _cached_hr_answer(user_query, generation):
+    """
+    Cached answer for the resident store's generation. Skipped while a newer
+    generation is on disk but not loaded yet: the new build may answer differently.
+    """
+    if generation is None or generation != kb_generation():
+        return None
+    return get_cached_answer("hr", user_query, generation)
+
+def handle_query(user_query, is_hr=None):
+    """
+    Route queries based on classified intent. is_hr comes from
+    openai_api.route_message; when it is None the query is classified here.
+    """
+    if is_hr is None:
+        is_hr = classify_intent(user_query) == "HR_Admin"
 
-    if intent == "HR_Admin":
-        context = search_hr_knowledge_base(user_query)
+    if is_hr:
+        # Cached answers are only valid for the KB generation of the store that built them
+        store, generation = get_kb_store()
+        cached = _cached_hr_answer(user_query, generation)
+        if cached:
+            return cached
+        context = search_hr_knowledge_base(user_query, store)
         if context.startswith("Knowledge base") or context.startswith("No relevant"):
             return context
-        return generate_answer_from_context(user_query, context)
+        answer = generate_answer_from_context(user_query, context)
+        put_cached_answer("hr", user_query, answer, generation)
+        return answer
 
     return None  # Let app.py handle non-HR queries
+
+def stream_query(user_query, is_hr=None):
+    """
+    Streaming counterpart of handle_query: None when the query is not for the
+    HR knowledge base (or there is none), otherwise an iterator over the answer.
+    Classification, the cache lookup and the KB search happen before returning.
+    """
+    if is_hr is None:
+        is_hr = classify_intent(user_query) == "HR_Admin"
+    if not is_hr:
+        return None
+
+    store, generation = get_kb_store()
+    cached = _cached_hr_answer(user_query, generation)
+    if cached:
+        return iter([cached])
+    context = search_hr_knowledge_base(user_query, store)
+    if context.startswith("Knowledge base"):
+        return None
+    if context.startswith("No relevant"):
+        return iter([context])
+    return _stream_answer(user_query, context, generation)
+
+def _stream_answer(user_query, context, generation):
+    parts = []
+    try:
+        for piece in stream_completion(**_answer_request(user_query, context)):
+            parts.append(piece)
+            yield piece
+    except Exception as e:
+        logging.error(f"❌ Streamed HR answer failed: {e}")
+        yield "\n\n⚠️ The answer was cut off. Please try again." if parts else "⚠️ I'm having trouble answering right now."
+        return
+    put_cached_answer("hr", user_query, "".join(parts).strip(), generation)
@@ -0,0 +1,237 @@
+import os
+import time
+import random
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+logging.basicConfig(level=logging.INFO)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+# Concurrent requests allowed per host (Graph, each SharePoint download host, ...)
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", os.getenv("GRAPH_HOST_CONCURRENCY", "8")))
+# Keep-alive connections kept per host, and how many hosts keep a pool
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(max(16, HTTP_HOST_CONCURRENCY))))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "32"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Safe to send twice; other methods (POST, PATCH) are only retried when the server can't have acted on them
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide pooled session. Cookies are refused, so concurrent threads share no state."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def host_semaphore(url):
+    """Shared per-host limiter so concurrent fan-out can't flood a single host."""
+    host = urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(HTTP_HOST_CONCURRENCY)
+        return _host_limits[host]
+
+
+def _record(host, status, seconds):
+    with _stats_lock:
+        stats = _stats.setdefault(host, {"requests": 0, "errors": 0, "statuses": {}, "total_ms": 0.0, "max_ms": 0.0})
+        stats["requests"] += 1
+        if status is None:
+            stats["errors"] += 1
+        else:
+            stats["statuses"][str(status)] = stats["statuses"].get(str(status), 0) + 1
+        stats["total_ms"] += seconds * 1000
+        stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+
+
+def request(method, url, headers=None, json=None, timeout=None, **kwargs):
+    """One pooled request under the host's concurrency limit, with timeouts and per-host counters."""
+    host = urlparse(url).netloc
+    with host_semaphore(url):
+        started = time.monotonic()
+        try:
+            res = get_session().request(
+                method, url, headers=headers, json=json,
+                timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), **kwargs
+            )
+        except Exception:
+            _record(host, None, time.monotonic() - started)
+            raise
+    _record(host, res.status_code, time.monotonic() - started)
+    return res
+
+
+def get(url, **kwargs):
+    return request("get", url, **kwargs)
+
+
+def retry_after_seconds(res):
+    try:
+        return float(res.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff. A server's Retry-After is honoured as the minimum."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, HTTP_BACKOFF_BASE)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _not_sent(error):
+    """True if the request failed before it reached the server (connect timeout, refused, DNS)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+
+def request_with_retries(method, url, max_retries=2, deadline=None, idempotent=None, **kwargs):
+    """
+    request() retried with backoff on connection errors, 429 and 5xx. Gives up
+    early when the wait would pass the monotonic deadline. Returns the last
+    response, or None if every attempt failed to connect.
+
+    Non-idempotent requests (POST unless idempotent=True) are only retried on
+    429 and on errors before the request was sent: after a 5xx or read timeout
+    the server may already have acted on it.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    res = None
+    for attempt in range(max_retries + 1):
+        delay = None
+        try:
+            res = request(method, url, **kwargs)
+            if res.status_code not in RETRY_STATUSES:
+                return res
+            if not idempotent and res.status_code != 429:
+                return res
+            delay = backoff_delay(attempt, retry_after_seconds(res))
+            logging.warning(f"{url} returned {res.status_code}. Attempt {attempt + 1}/{max_retries + 1}")
+        except requests.RequestException as e:
+            logging.error(f"Request error on {url}: {e}")
+            if not idempotent and not _not_sent(e):
+                return None
+            delay = backoff_delay(attempt)
+        if attempt == max_retries:
+            break
+        if deadline is not None and time.monotonic() + delay > deadline:
+            logging.warning(f"Retrying {url} would pass the deadline, giving up.")
+            break
+        time.sleep(delay)
+    return res
+
+
+def download(url, fileobj, max_bytes=None, max_retries=2, deadline=None, cancel_event=None):
+    """
+    Stream a GET response body into fileobj without buffering it in memory,
+    holding the host's slot for the whole transfer. Retried like
+    request_with_retries. Stops between chunks and before each retry once
+    cancel_event is set or the monotonic deadline has passed. Returns the number
+    of bytes written, or None if the download failed, was stopped or would
+    exceed max_bytes.
+    """
+    host = urlparse(url).netloc
+
+    def stopped():
+        if cancel_event is not None and cancel_event.is_set():
+            logging.warning(f"⚠️ Download of {url} cancelled")
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            logging.warning(f"⚠️ Download of {url} passed its deadline")
+            return True
+        return False
+
+    for attempt in range(max_retries + 1):
+        delay = None
+        if stopped():
+            return None
+        read_timeout = HTTP_READ_TIMEOUT
+        if deadline is not None:
+            read_timeout = max(0.1, min(HTTP_READ_TIMEOUT, deadline - time.monotonic()))
+        with host_semaphore(url):
+            started = time.monotonic()
+            status = None
+            try:
+                with get_session().get(url, stream=True, timeout=(HTTP_CONNECT_TIMEOUT, read_timeout)) as res:
+                    status = res.status_code
+                    if status == 200:
+                        length = int(res.headers.get("Content-Length") or 0)
+                        if max_bytes and length > max_bytes:
+                            logging.warning(f"⚠️ {url} is {length} bytes, over the {max_bytes} byte limit")
+                            return None
+                        fileobj.seek(0)
+                        fileobj.truncate()
+                        written = 0
+                        for chunk in res.iter_content(DOWNLOAD_CHUNK_BYTES):
+                            if stopped():
+                                return None
+                            written += len(chunk)
+                            if max_bytes and written > max_bytes:
+                                logging.warning(f"⚠️ {url} passed the {max_bytes} byte limit while downloading")
+                                return None
+                            fileobj.write(chunk)
+                        fileobj.flush()
+                        return written
+                    if status not in RETRY_STATUSES:
+                        logging.warning(f"⚠️ Download of {url} returned {status}")
+                        return None
+                    delay = backoff_delay(attempt, retry_after_seconds(res))
+            except requests.RequestException as e:
+                status = None
+                logging.error(f"Download error on {url}: {e}")
+                delay = backoff_delay(attempt)
+            finally:
+                _record(host, status, time.monotonic() - started)
+        if attempt == max_retries:
+            break
+        if deadline is not None and time.monotonic() + delay > deadline:
+            logging.warning(f"Retrying {url} would pass the deadline, giving up.")
+            break
+        # Sleep on the cancel event so a cancellation ends the backoff early
+        if cancel_event is not None:
+            if cancel_event.wait(delay):
+                break
+        else:
+            time.sleep(delay)
+    return None
+
+
+def http_stats():
+    with _stats_lock:
+        return {
+            host: dict(
+                stats,
+                statuses=dict(stats["statuses"]),
+                total_ms=round(stats["total_ms"], 1),
+                max_ms=round(stats["max_ms"], 1),
+                avg_ms=round(stats["total_ms"] / stats["requests"], 1) if stats["requests"] else None,
+            )
+            for host, stats in _stats.items()
+        }
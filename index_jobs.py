@@ -0,0 +1,164 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from knowledge_base.build_index import build_index, INDEX_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process single writer applies
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+
+INDEX_JOBS_DB = os.getenv("INDEX_JOBS_DB", "index_jobs.db")
+INDEX_LOCK_FILE = f"{INDEX_PATH}.lock"
+# How often an idle writer looks for jobs queued by other app processes
+INDEX_JOB_POLL_SECONDS = float(os.getenv("INDEX_JOB_POLL_SECONDS", "5"))
+
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _connect():
+    return sqlite3.connect(INDEX_JOBS_DB, timeout=30)
+
+
+def init_index_jobs():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS index_jobs (
+            job_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            filename TEXT,
+            requested_by TEXT,
+            status TEXT NOT NULL,
+            run_id TEXT,
+            files_total INTEGER DEFAULT 0,
+            files_loaded INTEGER DEFAULT 0,
+            chunks_embedded INTEGER DEFAULT 0,
+            generation TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_index_jobs_status ON index_jobs (status)')
+    conn.commit()
+    conn.close()
+
+
+def enqueue_index_job(kind, filename=None, requested_by=None):
+    """
+    Queue an index update and return its job id immediately. kind is "upload",
+    "delete", "startup" or "full" (a full rebuild). All jobs queued while a build
+    is running are served together by the next build.
+    """
+    job_id = uuid.uuid4().hex
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO index_jobs (job_id, kind, filename, requested_by, status, created_at)
+        VALUES (?, ?, ?, ?, 'queued', ?)
+    ''', (job_id, kind, filename, requested_by, time.time()))
+    conn.commit()
+    conn.close()
+    start_index_worker()
+    _wake.set()
+    return job_id
+
+
+def get_index_job(job_id):
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT * FROM index_jobs WHERE job_id = ?', (job_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def _claim_jobs(run_id):
+    """Take every queued job into this run. Called with the index lock held."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    # Whoever ran these died without releasing them (we hold the lock now)
+    c.execute("UPDATE index_jobs SET status = 'queued', run_id = NULL WHERE status = 'running'")
+    c.execute('''
+        UPDATE index_jobs SET status = 'running', run_id = ?, started_at = ?
+        WHERE status = 'queued'
+    ''', (run_id, time.time()))
+    c.execute('SELECT kind FROM index_jobs WHERE run_id = ?', (run_id,))
+    kinds = [row[0] for row in c.fetchall()]
+    conn.commit()
+    conn.close()
+    return kinds
+
+
+def _update_run(run_id, **fields):
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    conn = _connect()
+    c = conn.cursor()
+    c.execute(f'UPDATE index_jobs SET {assignments} WHERE run_id = ?', list(fields.values()) + [run_id])
+    conn.commit()
+    conn.close()
+
+
+def _run_pending():
+    """One build for everything queued so far. Returns the number of jobs served."""
+    lock_file = open(INDEX_LOCK_FILE, "a")
+    try:
+        if fcntl:
+            # Single writer across app processes as well as threads
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        run_id = uuid.uuid4().hex
+        kinds = _claim_jobs(run_id)
+        if not kinds:
+            return 0
+
+        started = time.time()
+        logging.info(f"📦 Index run {run_id[:8]} serving {len(kinds)} job(s)")
+        try:
+            generation = build_index(
+                full="full" in kinds,
+                progress=lambda **counts: _update_run(run_id, **counts),
+            )
+            _update_run(run_id, status="done", generation=generation, finished_at=time.time())
+            logging.info(f"✅ Index run {run_id[:8]} finished in {time.time() - started:.1f}s")
+        except Exception as e:
+            logging.exception("❌ Index run failed:")
+            _update_run(run_id, status="failed", error=str(e), finished_at=time.time())
+        return len(kinds)
+    finally:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _worker_loop():
+    while True:
+        _wake.wait(INDEX_JOB_POLL_SECONDS)
+        _wake.clear()
+        try:
+            _run_pending()
+        except Exception:
+            logging.exception("❌ Index worker error:")
+
+
+def start_index_worker():
+    """Start this process's single index writer thread, once."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="index-writer", daemon=True)
+            _worker.start()
+
+
+init_index_jobs()
@@ -0,0 +1,164 @@
+"""
+Background ingestion worker. Crawls every drive in the drive catalog, extracts
+text with extractor.py, embeds it and writes the prebuilt file index that
+search_all_files looks up at query time.
+
+    python ingest.py              # single pass
+    python ingest.py --loop 900   # crawl again every 15 minutes
+"""
+import os
+import time
+import logging
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from msal_auth import build_msal_app
+from drive_catalog import refresh_catalog, get_drives, tenant_from_token
+from extraction_cache import file_version, failed_recently
+from semantic_search import embed_texts
+from graph_api import (
+    GRAPH_API_URL,
+    GRAPH_BATCH_SIZE,
+    retry_request,
+    discover_all_drives,
+    get_files_with_download_urls,
+    extract_files,
+)
+import file_index
+
+logging.basicConfig(level=logging.INFO)
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+INGEST_EXTRACTION_TIMEOUT = float(os.getenv("INGEST_EXTRACTION_TIMEOUT", "600"))
+FILE_INDEX_TEXT_CHARS = int(os.getenv("FILE_INDEX_TEXT_CHARS", "20000"))
+
+
+def get_app_token():
+    """App-only Graph token (client credentials) for crawling without a signed-in user."""
+    result = build_msal_app().acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+    if "access_token" not in result:
+        logging.error(f"❌ Could not acquire app token: {result.get('error_description')}")
+        return None
+    return result["access_token"]
+
+
+def crawl_drive(token, drive_id):
+    """Page through the drive's delta feed. Returns (changed files, deleted ids, new deltaLink)."""
+    headers = {"Authorization": f"Bearer {token}"}
+    full_sync_url = f"{GRAPH_API_URL}/drives/{drive_id}/root/delta"
+    url = file_index.get_delta_link(drive_id) or full_sync_url
+    changed, deleted, delta_link = [], [], None
+
+    while url:
+        res = retry_request(url, dict(headers))
+        if res is not None and res.status_code == 410 and url != full_sync_url:
+            logging.warning(f"⚠️ Delta token expired for drive {drive_id}. Resyncing.")
+            url, changed, deleted = full_sync_url, [], []
+            continue
+        if res is None or res.status_code != 200:
+            logging.error(f"❌ Delta crawl failed for drive {drive_id}")
+            return changed, deleted, None
+
+        data = res.json()
+        for item in data.get("value", []):
+            if "deleted" in item:
+                deleted.append(item["id"])
+            elif "file" in item:
+                item.setdefault("parentReference", {}).setdefault("driveId", drive_id)
+                changed.append(item)
+        url = data.get("@odata.nextLink")
+        delta_link = data.get("@odata.deltaLink") or delta_link
+
+    return changed, deleted, delta_link
+
+
+def ingest_drive(token, drive):
+    drive_id = drive["drive_id"]
+    changed, deleted, delta_link = crawl_drive(token, drive_id)
+
+    if deleted:
+        file_index.delete_files(deleted)
+
+    versions = file_index.get_versions([f["id"] for f in changed])
+    todo = [f for f in changed if versions.get(f["id"]) != file_version(f)]
+
+    # Files whose extraction failed on an earlier pass were stored without a version; the delta feed won't list them again
+    seen = {f["id"] for f in changed} | set(deleted)
+    retry = [
+        {"id": item_id, "parentReference": {"driveId": drive_id}}
+        for item_id in file_index.get_unversioned(drive_id)
+        if item_id not in seen and not failed_recently(item_id)
+    ]
+    for j in range(0, len(retry), GRAPH_BATCH_SIZE):
+        metas = get_files_with_download_urls(retry[j:j + GRAPH_BATCH_SIZE], token)
+        for meta in metas.values():
+            meta.setdefault("parentReference", {}).setdefault("driveId", drive_id)
+            todo.append(meta)
+    logging.info(f"📂 Drive {drive_id}: {len(todo)} new/changed or retried, {len(deleted)} deleted")
+
+    for i in range(0, len(todo), INGEST_BATCH_SIZE):
+        batch = todo[i:i + INGEST_BATCH_SIZE]
+
+        # Delta items don't always carry a download URL
+        need_urls = [f for f in batch if "@microsoft.graph.downloadUrl" not in f]
+        for j in range(0, len(need_urls), GRAPH_BATCH_SIZE):
+            metas = get_files_with_download_urls(need_urls[j:j + GRAPH_BATCH_SIZE], token)
+            for f in need_urls[j:j + GRAPH_BATCH_SIZE]:
+                if f["id"] in metas:
+                    f["@microsoft.graph.downloadUrl"] = metas[f["id"]].get("@microsoft.graph.downloadUrl")
+
+        texts, incomplete = extract_files(batch, timeout=INGEST_EXTRACTION_TIMEOUT)
+        if incomplete:
+            logging.warning(f"⚠️ {len(incomplete)} files were not fully extracted; they are indexed by name and retried on the next crawl")
+        contents = [(texts.get(f["id"]) or f.get("name", ""))[:2000] for f in batch]
+        vectors = embed_texts(contents)
+
+        file_index.upsert_files([
+            {
+                "item_id": f["id"],
+                "drive_id": drive_id,
+                "site_id": drive["site_id"],
+                "name": f.get("name"),
+                # No version until extraction succeeds, so a failed or timed-out file is retried
+                "version": None if f["id"] in incomplete else file_version(f),
+                "text": texts.get(f["id"], "")[:FILE_INDEX_TEXT_CHARS],
+                "vector": vector,
+            }
+            for f, vector in zip(batch, vectors)
+        ])
+
+    # Only advance the cursor once everything up to it is stored
+    if delta_link:
+        file_index.save_delta_link(drive_id, delta_link)
+
+
+def run_once():
+    token = get_app_token()
+    if not token:
+        return
+    started = time.time()
+    # The app-only token sees every drive in the tenant: keep that list apart from the catalog users search
+    catalog_id = f"{tenant_from_token(token)}:crawler"
+    refresh_catalog(token, discover_all_drives, catalog_id)
+    drives = get_drives(token, discover_all_drives, catalog_id)
+    for drive in drives:
+        try:
+            ingest_drive(token, drive)
+        except Exception as e:
+            logging.error(f"❌ Ingestion failed for drive {drive['drive_id']}: {e}")
+    file_index.build_file_index()
+    logging.info(f"✅ Ingestion pass over {len(drives)} drives finished in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loop", type=int, default=0, help="seconds between passes (0 = run once)")
+    args = parser.parse_args()
+
+    while True:
+        run_once()
+        if not args.loop:
+            break
+        time.sleep(args.loop)
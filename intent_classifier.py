@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+import numpy as np
+
+INTENT_EXAMPLES_PATH = os.getenv(
+    "INTENT_EXAMPLES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_examples.json")
+)
+# Minimum gap between the best and second-best class similarity to decide locally.
+# Higher = fewer local decisions, fewer mistakes; 1.0 sends everything to the LLM.
+INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.08"))
+# Classes trusted to be decided locally; HR vs general questions are left to the LLM,
+# since a wrong HR route answers from the knowledge base (see benchmarks/eval_intent_classifier.py)
+INTENT_FAST_PATH_LABELS = set(os.getenv("INTENT_FAST_PATH_LABELS", "file_search,greeting").split(","))
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+SELECTION_RE = re.compile(r"^\s*\d+(\s*,\s*\d+)*\s*$")
+# Words dropped from a file request to get the search keywords
+FILE_FILLER = {
+    "send", "me", "the", "file", "files", "document", "documents", "doc", "find", "get", "show", "please",
+    "can", "you", "share", "download", "a", "an", "of", "for", "i", "need", "want", "copy", "look", "looking",
+    "up", "search", "fetch", "give", "open", "email", "where", "is", "am", "on", "about", "to", "my", "report",
+    "pdf", "some", "from", "last", "latest", "with", "could", "would",
+}
+
+_stats = {"local": 0, "escalated": 0}
+_stats_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Word unigrams and bigrams."""
+    words = WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class CentroidClassifier:
+    """TF-IDF nearest-centroid classifier: cosine similarity to each class's mean example vector."""
+
+    def __init__(self, examples):
+        self.labels = sorted(examples)
+        documents = [(label, tokenize(text)) for label in self.labels for text in examples[label]]
+        df = Counter(term for _, tokens in documents for term in set(tokens))
+        self.vocab = {term: i for i, term in enumerate(sorted(df))}
+        self.idf = np.array([math.log((1 + len(documents)) / (1 + df[t])) + 1 for t in sorted(df)], dtype="float32")
+
+        centroids = np.zeros((len(self.labels), len(self.vocab)), dtype="float32")
+        for label, tokens in documents:
+            centroids[self.labels.index(label)] += self._vector(tokens)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+
+    def _vector(self, tokens):
+        vector = np.zeros(len(self.vocab), dtype="float32")
+        for term, count in Counter(tokens).items():
+            i = self.vocab.get(term)
+            if i is not None:
+                vector[i] = count * self.idf[i]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def predict(self, text):
+        """(label, confidence, similarities); confidence is the best-minus-second similarity gap."""
+        similarities = self.centroids @ self._vector(tokenize(text))
+        order = np.argsort(similarities)[::-1]
+        confidence = float(similarities[order[0]] - similarities[order[1]])
+        return self.labels[order[0]], confidence, dict(zip(self.labels, similarities.tolist()))
+
+
+def load_examples(path=INTENT_EXAMPLES_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+_classifier = CentroidClassifier(load_examples())
+
+
+def file_keywords(text):
+    words = WORD_RE.findall(text.lower().replace("'s", ""))
+    return " ".join(w for w in words if w not in FILE_FILLER)
+
+
+def classify_locally(user_input, threshold=None):
+    """
+    Route a message without an LLM when it is unambiguous. Returns the same
+    shape as openai_api.route_message ({"intent", "data", "hr"}), plus
+    "control" for bare selections / "cancel", or None to escalate.
+    """
+    threshold = INTENT_FAST_PATH_THRESHOLD if threshold is None else threshold
+    text = user_input.strip()
+    if SELECTION_RE.match(text) or text.lower() == "cancel":
+        return _decided({"intent": "control", "data": text.lower(), "hr": False})
+
+    label, confidence, _ = _classifier.predict(text)
+    if confidence < threshold or label not in INTENT_FAST_PATH_LABELS:
+        return _escalated()
+    if label == "file_search":
+        keywords = file_keywords(text)
+        if len(keywords) < 2:
+            return _escalated()
+        return _decided({"intent": "file_search", "data": keywords, "hr": False})
+    if label == "hr":
+        return _decided({"intent": "general_response", "data": "", "hr": True})
+    return _decided({"intent": "general_response", "data": "", "hr": False})
+
+
+def _decided(route):
+    with _stats_lock:
+        _stats["local"] += 1
+    return route
+
+
+def _escalated():
+    with _stats_lock:
+        _stats["escalated"] += 1
+    return None
+
+
+def classifier_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["local"] + stats["escalated"]
+    stats["local_rate"] = round(stats["local"] / total, 3) if total else None
+    stats["threshold"] = INTENT_FAST_PATH_THRESHOLD
+    stats["labels"] = sorted(INTENT_FAST_PATH_LABELS)
+    return stats
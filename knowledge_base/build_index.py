@@ -1,8 +1,15 @@
 import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import OpenAIEmbeddings
+from langchain_community.embeddings import OpenAIEmbeddings, DeterministicFakeEmbedding
 from dotenv import load_dotenv
 
 load_dotenv()  # Loads OPENAI_API_KEY
@@ -11,53 +18,278 @@ load_dotenv()  # Loads OPENAI_API_KEY
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DOCUMENTS_PATH = os.path.join(BASE_DIR, "documents")
 INDEX_PATH = os.path.join(BASE_DIR, "faiss_index")
+GENERATION_FILE = os.path.join(INDEX_PATH, "GENERATION")
+MANIFEST_NAME = "manifest.json"
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+EMBED_BATCH_CHUNKS = int(os.getenv("KB_EMBED_BATCH_CHUNKS", "256"))
+# Processes that load and split documents; <= 1 loads in the calling process
+LOAD_WORKERS = int(os.getenv("KB_LOAD_WORKERS", str(os.cpu_count() or 1)))
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+# In-progress builds are saved here every KB_CHECKPOINT_CHUNKS chunks and resumed after a crash
+CHECKPOINT_PATH = f"{INDEX_PATH}.checkpoint"
+CHECKPOINT_CHUNKS = int(os.getenv("KB_CHECKPOINT_CHUNKS", "2048"))
+# "openai", or "fake" for deterministic offline embeddings (tests, benchmarks)
+KB_EMBEDDINGS = os.getenv("KB_EMBEDDINGS", "openai").lower()
+FAKE_EMBEDDING_DIM = int(os.getenv("KB_FAKE_EMBEDDING_DIM", "1536"))
 
-def load_documents(directory):
-    docs = []
+def get_embeddings():
+    if KB_EMBEDDINGS == "fake":
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_DIM)
+    return OpenAIEmbeddings()
+
+def publish_index(db, manifest):
+    """
+    Save the store and its manifest next to the live index, move the files into
+    place and then bump GENERATION, so running apps only ever load a complete index.
+    """
+    generation = str(int(time.time() * 1000))
+    staging_path = f"{INDEX_PATH}.{generation}.tmp"
+    db.save_local(staging_path)
+    with open(os.path.join(staging_path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.makedirs(INDEX_PATH, exist_ok=True)
+    for name in os.listdir(staging_path):
+        os.replace(os.path.join(staging_path, name), os.path.join(INDEX_PATH, name))
+    shutil.rmtree(staging_path, ignore_errors=True)
+    with open(f"{GENERATION_FILE}.tmp", "w") as f:
+        f.write(generation)
+    os.replace(f"{GENERATION_FILE}.tmp", GENERATION_FILE)
+    return generation
+
+def load_manifest(path=INDEX_PATH):
+    """{filename: {"hash", "chunk_ids"}} for the index at path, or {} if there is none."""
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path) or not os.path.exists(os.path.join(path, "index.faiss")):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Could not read index manifest: {e}")
+        return {}
+
+def save_checkpoint(db, manifest, full):
+    """Save the partial store into a fresh directory and point LATEST at it."""
+    name = str(int(time.time() * 1000))
+    path = os.path.join(CHECKPOINT_PATH, name)
+    db.save_local(path)
+    with open(os.path.join(path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f)
+    with open(os.path.join(CHECKPOINT_PATH, "LATEST.tmp"), "w") as f:
+        json.dump({"name": name, "full": full}, f)
+    os.replace(os.path.join(CHECKPOINT_PATH, "LATEST.tmp"), os.path.join(CHECKPOINT_PATH, "LATEST"))
+    for old in os.listdir(CHECKPOINT_PATH):
+        if old not in (name, "LATEST"):
+            shutil.rmtree(os.path.join(CHECKPOINT_PATH, old), ignore_errors=True)
+    print(f"💾 Checkpoint saved ({sum(len(m['chunk_ids']) for m in manifest.values())} chunks).")
+
+def load_checkpoint(full):
+    """Path of the last checkpoint usable for this build, or None."""
+    try:
+        with open(os.path.join(CHECKPOINT_PATH, "LATEST")) as f:
+            latest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A full rebuild may only resume from a full rebuild's checkpoint
+    if full and not latest.get("full"):
+        return None
+    path = os.path.join(CHECKPOINT_PATH, latest["name"])
+    return path if load_manifest(path) else None
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_documents(directory):
+    """{filename: full path} of the supported documents in the directory."""
     if not os.path.exists(directory):
         print(f"❌ Directory does not exist: {directory}")
-        return docs
-
+        return {}
+    files = {}
     for file in os.listdir(directory):
         full_path = os.path.join(directory, file)
-        try:
-            if file.endswith(".pdf"):
-                loader = PyMuPDFLoader(full_path)
-            elif file.endswith(".docx"):
-                loader = Docx2txtLoader(full_path)
-            elif file.endswith(".txt"):
-                loader = TextLoader(full_path)
-            else:
-                print(f"⚠️ Skipped unsupported file: {file}")
-                continue
-
-            file_docs = loader.load()
-            docs.extend(file_docs)
-            print(f"📄 Loaded {len(file_docs)} chunks from: {file}")
-        except Exception as e:
-            print(f"❌ Failed to load {file}: {e}")
-    return docs
-
-def build_index():
+        if not os.path.isfile(full_path):
+            continue
+        if not file.endswith(SUPPORTED_EXTENSIONS):
+            print(f"⚠️ Skipped unsupported file: {file}")
+            continue
+        files[file] = full_path
+    return files
+
+def load_file(full_path):
+    file = os.path.basename(full_path)
+    if file.endswith(".pdf"):
+        loader = PyMuPDFLoader(full_path)
+    elif file.endswith(".docx"):
+        loader = Docx2txtLoader(full_path)
+    else:
+        loader = TextLoader(full_path)
+    file_docs = loader.load()
+    print(f"📄 Loaded {len(file_docs)} chunks from: {file}")
+    return file_docs
+
+def chunk_file(file, full_path, digest):
+    """Load and split one document; chunk ids derive from its name and content hash."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(load_file(full_path))
+    ids = [f"{file}::{digest[:16]}::{i}" for i in range(len(chunks))]
+    return chunks, ids
+
+def iter_chunked_files(jobs, workers=None):
+    """
+    Load and split (file, full_path, digest) jobs on a process pool and yield
+    (file, chunks, ids, error) as each file finishes, so embedding can start
+    before the whole corpus is loaded. At most a few files per worker are in
+    flight, which bounds the memory held by finished-but-unconsumed results.
+    """
+    workers = LOAD_WORKERS if workers is None else workers
+    if workers <= 1 or len(jobs) <= 1:
+        for file, full_path, digest in jobs:
+            try:
+                yield (file, *chunk_file(file, full_path, digest), None)
+            except Exception as e:
+                yield file, None, None, e
+        return
+
+    pending = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = {}
+        def fill():
+            for file, full_path, digest in pending:
+                in_flight[pool.submit(chunk_file, file, full_path, digest)] = file
+                if len(in_flight) >= workers * 2:
+                    break
+        fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file = in_flight.pop(future)
+                try:
+                    yield (file, *future.result(), None)
+                except Exception as e:
+                    yield file, None, None, e
+            fill()
+
+def build_index(full=False, progress=None):
+    """
+    Bring the FAISS index in line with the documents folder. Only added or
+    changed files are embedded; chunks of removed or changed files are deleted
+    by id. full=True rebuilds everything from scratch (compaction).
+    progress(**counts), if given, is called with files_total, files_loaded and
+    chunks_embedded as the build advances. Returns the published generation.
+    """
+    def report(**counts):
+        if progress:
+            progress(**counts)
+
     print(f"🔄 Loading documents from: {DOCUMENTS_PATH}")
-    documents = load_documents(DOCUMENTS_PATH)
+    files = list_documents(DOCUMENTS_PATH)
+    embeddings = get_embeddings()
+
+    db = None
+    base_path = load_checkpoint(full)
+    resumed = base_path is not None
+    if resumed:
+        print(f"♻️ Resuming interrupted build from checkpoint: {base_path}")
+    elif not full:
+        base_path = INDEX_PATH
+    manifest = load_manifest(base_path) if base_path else {}
+    if manifest:
+        db = FAISS.load_local(base_path, embeddings, allow_dangerous_deserialization=True)
+    elif not full and os.path.exists(os.path.join(INDEX_PATH, "index.faiss")):
+        print("ℹ️ Existing index has no manifest. Doing a full rebuild.")
+
+    hashes = {}
+    for file, full_path in list(files.items()):
+        try:
+            hashes[file] = file_hash(full_path)
+        except OSError:
+            # Deleted while we were listing: treat it as removed
+            files.pop(file)
 
-    if not documents:
+    removed = [f for f in manifest if f not in files]
+    changed = [f for f in files if f in manifest and manifest[f]["hash"] != hashes[f]]
+    added = [f for f in files if f not in manifest]
+
+    if db is not None and not resumed and not (removed or changed or added):
+        print("✅ Index is up to date.")
+        return None
+
+    if db is None and not files:
         print("❌ No documents loaded. Please add PDFs, DOCX, or TXT files.")
-        return
+        return None
 
-    print(f"✅ Loaded {len(documents)} documents. Splitting into chunks...")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-    texts = splitter.split_documents(documents)
-    print(f"🧩 Split into {len(texts)} text chunks.")
+    print(f"🧮 {len(added)} added, {len(changed)} changed, {len(removed)} removed.")
+    report(files_total=len(changed) + len(added), files_loaded=0, chunks_embedded=0)
 
-    print("🔄 Creating vector embeddings...")
-    embeddings = OpenAIEmbeddings()
-    db = FAISS.from_documents(texts, embeddings)
+    stale_ids = [cid for f in removed + changed for cid in manifest[f]["chunk_ids"]]
+    if db is not None and stale_ids:
+        db.delete(stale_ids)
+    for f in removed + changed:
+        manifest.pop(f, None)
+
+    # Chunks stream from the loader pool into fixed-size embedding batches, so
+    # only one batch of unembedded chunks is held in memory at a time. Files
+    # enter the manifest (and so a checkpoint) once all their chunks are embedded.
+    texts, ids = [], []
+    loaded_files = {}
+    embedded = checkpointed = 0
+
+    def embed_batch(batch, batch_ids):
+        nonlocal db, embedded
+        if db is None:
+            db = FAISS.from_documents(batch, embeddings, ids=batch_ids)
+        else:
+            db.add_documents(batch, ids=batch_ids)
+        embedded += len(batch)
+        report(chunks_embedded=embedded)
+
+    def checkpoint():
+        nonlocal texts, ids, checkpointed
+        if texts:
+            embed_batch(texts, ids)
+            texts, ids = [], []
+        manifest.update(loaded_files)
+        loaded_files.clear()
+        if db is not None:
+            save_checkpoint(db, manifest, full)
+        checkpointed = embedded
+
+    jobs = [(file, files[file], hashes[file]) for file in changed + added]
+    print(f"🔄 Loading, splitting and embedding {len(jobs)} documents...")
+    for loaded, (file, chunks, chunk_ids, error) in enumerate(iter_chunked_files(jobs), start=1):
+        report(files_loaded=loaded)
+        if error:
+            print(f"❌ Failed to load {file}: {error}")
+            continue
+        texts.extend(chunks)
+        ids.extend(chunk_ids)
+        loaded_files[file] = {"hash": hashes[file], "chunk_ids": chunk_ids}
+        while len(texts) >= EMBED_BATCH_CHUNKS:
+            embed_batch(texts[:EMBED_BATCH_CHUNKS], ids[:EMBED_BATCH_CHUNKS])
+            texts, ids = texts[EMBED_BATCH_CHUNKS:], ids[EMBED_BATCH_CHUNKS:]
+        if embedded - checkpointed >= CHECKPOINT_CHUNKS:
+            checkpoint()
+    if texts:
+        embed_batch(texts, ids)
+    manifest.update(loaded_files)
+    print(f"🧩 Embedded {embedded} new text chunks.")
+
+    if db is None:
+        print("❌ No documents loaded. Please add PDFs, DOCX, or TXT files.")
+        return None
 
     print(f"💾 Saving FAISS index to: {INDEX_PATH}")
-    db.save_local(INDEX_PATH)
-    print("✅ Index built and saved successfully.")
+    generation = publish_index(db, manifest)
+    shutil.rmtree(CHECKPOINT_PATH, ignore_errors=True)
+    print(f"✅ Index built and saved successfully (generation {generation}).")
+    return generation
 
 if __name__ == "__main__":
-    build_index()
+    # python build_index.py          -> incremental update
+    # python build_index.py --full   -> full rebuild / compaction
+    build_index(full="--full" in sys.argv[1:])
@@ -3,10 +3,68 @@ import json
 import re
 from openai import OpenAI
 from dotenv import load_dotenv
+from intent_classifier import classify_locally
+from answer_cache import get_cached_answer, put_cached_answer
 
 load_dotenv()
+# OPENAI_BASE_URL, if set, points the client at another endpoint (e.g. benchmarks/mock_llm.py)
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+def route_message(user_input):
+    """
+    One GPT-4o call that does the work of detect_intent_and_extract and
+    hr_router.classify_intent: returns {"intent", "data", "hr"}.
+    On failure "hr" is None so the HR router classifies the message itself.
+    Messages the local classifier is confident about never reach the LLM.
+    """
+    local = classify_locally(user_input)
+    if local:
+        return local
+
+    system_prompt = (
+        "You're the router for a document assistant application that also answers HR/admin questions from an HR knowledge base.\n\n"
+        "Reply strictly in JSON format only, like:\n"
+        "{\"intent\": \"file_search\", \"data\": \"maternity\", \"hr\": false}\n"
+        "OR\n"
+        "{\"intent\": \"general_response\", \"data\": \"\", \"hr\": true}\n\n"
+        "Rules for 'intent' and 'data':\n"
+        "- Use intent 'file_search' if user is trying to get, share, show, download, send, or find a document, info, policy, file, report, or manual.\n"
+        "- If the input includes file-related terms like 'file', 'document', or 'report', assume it's a file search — even if the topic sounds HR-related like 'leave policy'.\n"
+        "- Extract the clean keyword(s) related to the file — remove filler like: file, document, report, info, etc.\n"
+        "- Do not invent keywords. If unclear, return intent as 'general_response' and data as ''.\n"
+        "- Use lowercase unless proper name (e.g., 'Anup').\n\n"
+        "Rule for 'hr':\n"
+        "- Classify the user query as one of: HR_Admin, File_Operation, Email_Operation, General. "
+        "Set 'hr' to true only if it is HR_Admin, otherwise false.\n\n"
+        "NEVER return anything except the strict JSON format."
+    )
+
+    try:
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0
+        )
+        result = json.loads(response.choices[0].message.content)
+        if result.get("intent") in ("file_search", "general_response"):
+            return {
+                "intent": result["intent"],
+                "data": (result.get("data") or "").strip(),
+                "hr": bool(result.get("hr")),
+            }
+        print("❌ Unexpected routing result:", result)
+    except Exception as e:
+        print("❌ GPT error during routing:", e)
+
+    fallback = detect_intent_and_extract(user_input)
+    fallback["hr"] = None
+    return fallback
+
+
 def detect_intent_and_extract(user_input):
     """
     Detect user intent and extract a clean query using GPT-4o.
@@ -70,23 +128,82 @@ def answer_general_query(user_input):
     """
     Handles general queries. Attempts basic doc-related answer first.
     Falls back to broader ChatGPT-style answer if appropriate.
+    Repeated questions are served from the answer cache.
+    """
+    cached = get_cached_answer("general", user_input)
+    if cached:
+        return cached
+    answer = _answer_general_query(user_input)
+    if not answer.startswith("⚠️"):
+        put_cached_answer("general", user_input, answer)
+    return answer
+
+def stream_general_query(user_input):
+    """
+    Same answer as answer_general_query, yielded in pieces as the model
+    produces them. Cached answers are yielded whole.
     """
+    cached = get_cached_answer("general", user_input)
+    if cached:
+        yield cached
+        return
+    request = _small_talk_request(user_input) if _is_small_talk(user_input) else _chatgpt_style_request(user_input)
+    parts = []
+    try:
+        for piece in stream_completion(**request):
+            parts.append(piece)
+            yield piece
+    except Exception as e:
+        print("❌ GPT error during streamed general query:", e)
+        yield "\n\n⚠️ The answer was cut off. Please try again." if parts else "⚠️ I'm having trouble responding. Please try again shortly."
+        return
+    put_cached_answer("general", user_input, "".join(parts).strip())
+
+def stream_completion(**request):
+    """Yield the content deltas of a streamed chat completion."""
+    for chunk in client.chat.completions.create(stream=True, **request):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def _is_small_talk(user_input):
+    low_context_phrases = ["hi", "hello", "thank you", "who are you", "what can you do"]
+    return any(p in user_input.lower() for p in low_context_phrases)
+
+def _small_talk_request(user_input):
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": (
+                "You are a polite and helpful assistant inside a document assistant chatbot. "
+                "Respond to greetings and user messages in a friendly, short way."
+            )},
+            {"role": "user", "content": user_input}
+        ],
+        "temperature": 0.5,
+    }
+
+def _chatgpt_style_request(user_input):
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are ChatGPT, an intelligent assistant that can answer general world knowledge, "
+                    "recent events, news-style questions, and everyday queries. "
+                    "Even if some events are recent, do your best to provide an informed response."
+                )
+            },
+            {"role": "user", "content": user_input}
+        ],
+        "temperature": 0.7,
+    }
+
+def _answer_general_query(user_input):
     try:
         # If it's a greeting or small talk, use doc-assistant tone
-        low_context_phrases = ["hi", "hello", "thank you", "who are you", "what can you do"]
-
-        if any(p in user_input.lower() for p in low_context_phrases):
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": (
-                        "You are a polite and helpful assistant inside a document assistant chatbot. "
-                        "Respond to greetings and user messages in a friendly, short way."
-                    )},
-                    {"role": "user", "content": user_input}
-                ],
-                temperature=0.5
-            )
+        if _is_small_talk(user_input):
+            response = client.chat.completions.create(**_small_talk_request(user_input))
             return response.choices[0].message.content.strip()
 
         # ✅ Otherwise, try answering broadly like ChatGPT
@@ -102,22 +219,8 @@ def answer_with_chatgpt_style(user_input):
     Allows answering general world questions, news-style questions, etc.
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are ChatGPT, an intelligent assistant that can answer general world knowledge, "
-                        "recent events, news-style questions, and everyday queries. "
-                        "Even if some events are recent, do your best to provide an informed response."
-                    )
-                },
-                {"role": "user", "content": user_input}
-            ],
-            temperature=0.7
-        )
+        response = client.chat.completions.create(**_chatgpt_style_request(user_input))
         return response.choices[0].message.content.strip()
     except Exception as e:
         print("❌ Error in ChatGPT-style fallback:", e)
-        return "⚠️ I'm having trouble providing that answer right now."
\ No newline at end of file
+        return "⚠️ I'm having trouble providing that answer right now."
@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+
+RESULT_STORE_DB = os.getenv("RESULT_STORE_DB", "result_store.db")
+# How long a search result list stays selectable; matches the session lifetime by default
+RESULT_STORE_TTL_SECONDS = int(os.getenv("RESULT_STORE_TTL_SECONDS", "3600"))
+
+_stats = {"saved": 0, "hits": 0, "misses": 0, "expired": 0}
+_stats_lock = threading.Lock()
+
+
+def _connect():
+    return sqlite3.connect(RESULT_STORE_DB, timeout=30)
+
+
+def init_result_store():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS result_sets (
+            result_id TEXT PRIMARY KEY,
+            owner TEXT,
+            total INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS result_files (
+            result_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            item_id TEXT NOT NULL,
+            name TEXT,
+            web_url TEXT,
+            site_id TEXT,
+            score REAL,
+            extension TEXT,
+            PRIMARY KEY (result_id, position)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_result_sets_expiry ON result_sets (expires_at)')
+    conn.commit()
+    conn.close()
+
+
+def _bump(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _extension(name):
+    return os.path.splitext(name)[1].lower() if "." in name else ""
+
+
+def compact_file(file):
+    """The fields the file list, selection and email need from a ranked Graph item."""
+    return {
+        "id": file["id"],
+        "name": file.get("name", ""),
+        "webUrl": file.get("webUrl"),
+        "siteId": file.get("siteId") or file.get("parentReference", {}).get("siteId"),
+        "score": file.get("score", file.get("hybrid_score")),
+    }
+
+
+def save_results(files, owner=None):
+    """Store a ranked result list in compact form. Returns its result-set id."""
+    result_id = uuid.uuid4().hex
+    now = time.time()
+    rows = []
+    for position, file in enumerate(files):
+        f = compact_file(file)
+        rows.append((result_id, position, f["id"], f["name"], f["webUrl"], f["siteId"], f["score"], _extension(f["name"])))
+
+    conn = _connect()
+    c = conn.cursor()
+    _sweep(c, now)
+    c.execute(
+        'INSERT INTO result_sets (result_id, owner, total, expires_at) VALUES (?, ?, ?, ?)',
+        (result_id, owner, len(rows), now + RESULT_STORE_TTL_SECONDS)
+    )
+    c.executemany('INSERT INTO result_files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    _bump("saved")
+    return result_id
+
+
+def _live(c, result_id, owner):
+    """True if the result set exists, belongs to owner and hasn't expired."""
+    c.execute('SELECT owner, expires_at FROM result_sets WHERE result_id = ?', (result_id,))
+    row = c.fetchone()
+    if not row or (owner is not None and row[0] != owner):
+        _bump("misses")
+        return False
+    if row[1] < time.time():
+        _bump("expired")
+        return False
+    _bump("hits")
+    return True
+
+
+def _rows_to_files(rows):
+    return [{"id": r[0], "name": r[1], "webUrl": r[2], "siteId": r[3], "score": r[4]} for r in rows]
+
+
+def get_results(result_id, owner=None):
+    """The whole compact result list, or None if it is unknown or expired."""
+    if not result_id:
+        return None
+    conn = _connect()
+    c = conn.cursor()
+    if not _live(c, result_id, owner):
+        conn.close()
+        return None
+    c.execute('''
+        SELECT item_id, name, web_url, site_id, score FROM result_files
+        WHERE result_id = ? ORDER BY position
+    ''', (result_id,))
+    files = _rows_to_files(c.fetchall())
+    conn.close()
+    return files
+
+
+def get_page(result_id, page=1, per_page=5, extension=None, owner=None):
+    """
+    One page of a result list, optionally only files with the given extension:
+    {"files", "total", "file_types"}, or None if it is unknown or expired.
+    Only the requested rows are read.
+    """
+    if not result_id:
+        return None
+    conn = _connect()
+    c = conn.cursor()
+    if not _live(c, result_id, owner):
+        conn.close()
+        return None
+    # File types are listed from the full result list, before filtering
+    c.execute('SELECT DISTINCT extension FROM result_files WHERE result_id = ? AND extension != ?', (result_id, ""))
+    file_types = sorted(r[0] for r in c.fetchall())
+
+    where, params = 'result_id = ?', [result_id]
+    if extension:
+        where += " AND LOWER(name) LIKE ? ESCAPE '\\'"
+        params.append("%" + extension.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+    c.execute(f'SELECT COUNT(*) FROM result_files WHERE {where}', params)
+    total = c.fetchone()[0]
+    c.execute(f'''
+        SELECT item_id, name, web_url, site_id, score FROM result_files
+        WHERE {where} ORDER BY position LIMIT ? OFFSET ?
+    ''', params + [per_page, max(page - 1, 0) * per_page])
+    files = _rows_to_files(c.fetchall())
+    conn.close()
+    return {"files": files, "total": total, "file_types": file_types}
+
+
+def delete_results(result_id):
+    if not result_id:
+        return
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('DELETE FROM result_files WHERE result_id = ?', (result_id,))
+    c.execute('DELETE FROM result_sets WHERE result_id = ?', (result_id,))
+    conn.commit()
+    conn.close()
+
+
+def _sweep(c, now):
+    """Drop expired result sets (run on every save)."""
+    c.execute('SELECT result_id FROM result_sets WHERE expires_at < ?', (now,))
+    expired = [(r[0],) for r in c.fetchall()]
+    if expired:
+        c.executemany('DELETE FROM result_files WHERE result_id = ?', expired)
+        c.executemany('DELETE FROM result_sets WHERE result_id = ?', expired)
+    return len(expired)
+
+
+def result_store_stats():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), COALESCE(SUM(total), 0) FROM result_sets')
+    result_sets, files = c.fetchone()
+    conn.close()
+
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["result_sets"] = result_sets
+    stats["files"] = files
+    stats["ttl_seconds"] = RESULT_STORE_TTL_SECONDS
+    return stats
+
+
+init_result_store()
@@ -1,9 +1,12 @@
 import os
+import re
+import bisect
 import numpy as np
 import faiss
 import pickle
 from dotenv import load_dotenv
 from openai import OpenAI
+from embedding_cache import cached_embeddings
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -16,33 +19,346 @@ def cosine_similarity(vec1, vec2):
     b = np.array(vec2)
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def embed_texts(texts):
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Index factory settings. "auto" uses exact search below FAISS_ANN_THRESHOLD vectors, HNSW above.
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")  # auto | flat | ivf | hnsw
+FAISS_ANN_THRESHOLD = int(os.getenv("FAISS_ANN_THRESHOLD", "50000"))
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))  # 0 = 4 * sqrt(n)
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+def _embed_uncached(texts):
     response = client.embeddings.create(
         input=texts,
-        model="text-embedding-3-small"
+        model=EMBEDDING_MODEL
     )
-    return [item.embedding for item in response.data]
+    return [item.embedding for item in response.data], response.usage.total_tokens
+
+def embed_texts(texts):
+    """Embeddings via the on-disk cache; misses are batched to the provider's limits."""
+    return cached_embeddings(texts, EMBEDDING_MODEL, _embed_uncached)
+
+def normalize_vectors(matrix):
+    """L2-normalised float32 copy, so inner product equals cosine similarity."""
+    matrix = np.array(matrix, dtype="float32", copy=True)
+    faiss.normalize_L2(matrix)
+    return matrix
+
+def make_index(dim, size, kind=None, nlist=None, nprobe=None, m=None, ef_search=None):
+    """
+    Index factory over L2-normalised vectors with inner-product scoring:
+    exact (flat) for small sets, IVF or HNSW for large ones.
+    """
+    kind = kind or FAISS_INDEX_TYPE
+    if kind == "auto":
+        kind = "flat" if size < FAISS_ANN_THRESHOLD else "hnsw"
+
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+    if kind == "ivf":
+        nlist = nlist or FAISS_IVF_NLIST or max(1, min(int(4 * np.sqrt(size)), size))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = nprobe or FAISS_IVF_NPROBE
+        return index
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, m or FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = ef_search or FAISS_HNSW_EF_SEARCH
+        return index
+    raise ValueError(f"Unknown FAISS index type: {kind}")
+
+def build_vector_index(matrix, ids=None, kind=None, **params):
+    """Normalise, train if needed and fill an index from the factory. ids wraps it in an IndexIDMap."""
+    matrix = normalize_vectors(matrix)
+    index = make_index(matrix.shape[1], matrix.shape[0], kind, **params)
+    if not index.is_trained:
+        index.train(matrix)
+    if ids is not None:
+        index = faiss.IndexIDMap(index)
+        index.add_with_ids(matrix, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(matrix)
+    return index
 
-def build_faiss_index(files, index_name="file"):
+def apply_search_params(index):
+    """Apply the configured nprobe / efSearch to an index loaded from disk."""
+    params = faiss.ParameterSpace()
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVF):
+        params.set_index_parameter(index, "nprobe", FAISS_IVF_NPROBE)
+    elif isinstance(inner, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", FAISS_HNSW_EF_SEARCH)
+    return index
+
+def search_vectors(index, query_vectors, k):
+    """
+    Search any index from the factory (or a legacy L2 one) and return
+    (distances, ids) as squared L2 distances between normalised vectors,
+    i.e. 2 - 2 * cosine, so hybrid scoring keeps its previous scale.
+    """
+    if index.metric_type != faiss.METRIC_INNER_PRODUCT:
+        return index.search(np.asarray(query_vectors, dtype="float32"), k)
+    similarities, ids = index.search(normalize_vectors(query_vectors), k)
+    # Missing results (id -1) come back with a sentinel similarity; keep them at +inf
+    distances = np.full(similarities.shape, np.inf, dtype="float32")
+    found = ids >= 0
+    distances[found] = 2.0 - 2.0 * similarities[found]
+    return distances, ids
+
+def build_faiss_index(files, index_name="file", persist=False):
+    """
+    Embed the files and build an in-memory FAISS index over them.
+    Writing faiss_<index_name>.index / <index_name>_metadata.pkl is opt-in via persist.
+    """
     texts = [f.get("extracted_text") or f.get("name", "") for f in files]
     texts = [t[:2000] for t in texts]
 
-    embeddings = client.embeddings.create(
-        input=texts,
-        model="text-embedding-3-small"
-    ).data
-    matrix = np.array([e.embedding for e in embeddings]).astype("float32")
+    # Files from the prebuilt file index carry their vector already; embed only the rest
+    vectors = [f.pop("embedding", None) for f in files]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        for i, embedding in zip(missing, embed_texts([texts[i] for i in missing])):
+            vectors[i] = embedding
+    matrix = np.array(vectors).astype("float32")
+
+    # Per-request candidate sets are small and fully ranked, so search is always exact
+    index = build_vector_index(matrix, kind="flat")
+
+    if persist:
+        faiss.write_index(index, f"faiss_{index_name}.index")
+        with open(f"{index_name}_metadata.pkl", "wb") as f:
+            pickle.dump(files, f)
+        print(f"✅ FAISS index saved as faiss_{index_name}.index")
+
+    return index
+
+TOKEN_RE = re.compile(r"\w+")
+# For ASCII text, mapping every non-word character to a space and splitting gives the same tokens as TOKEN_RE, faster
+_ASCII_NON_WORD = str.maketrans({chr(c): " " for c in range(128) if not (chr(c).isalnum() or chr(c) == "_")})
+
+def _tokens(lowered):
+    if lowered.isascii():
+        return set(lowered.translate(_ASCII_NON_WORD).split())
+    return set(TOKEN_RE.findall(lowered))
+
+def build_term_index(entries):
+    """
+    Keyword index over stored documents, built when the file index is written
+    (file_index.build_file_index), not per query. entries: (item id, version, text).
+    Postings map each vocabulary token to document numbers; a suffix array over
+    the vocabulary finds every token containing a word (report -> reports,
+    prereport) by binary search, so keywords keep substring semantics.
+    """
+    docs = {}
+    postings = {}
+    for item_id, version, text in entries:
+        doc = len(docs)
+        docs[item_id] = (doc, version)
+        for token in _tokens(text.lower()):
+            postings.setdefault(token, []).append(doc)
 
-    index = faiss.IndexFlatL2(len(matrix[0]))
-    index.add(matrix)
+    vocab = sorted(postings)
+    joined = "\n".join(vocab)  # a newline never occurs inside a token and sorts before every word character
+    starts = np.cumsum([0] + [len(t) + 1 for t in vocab[:-1]]) if vocab else np.zeros(0, dtype="int64")
+    suffixes = [(joined[start + i:start + len(t)], start + i, n) for n, (t, start) in enumerate(zip(vocab, starts)) for i in range(len(t))]
+    suffixes.sort()
+    offsets = np.cumsum([0] + [len(postings[t]) for t in vocab])
+    return {
+        "docs": docs,
+        "vocab": joined,
+        "suffix_offsets": np.array([s[1] for s in suffixes], dtype="int64"),
+        "suffix_tokens": np.array([s[2] for s in suffixes], dtype="int64"),
+        "posting_offsets": np.asarray(offsets, dtype="int64"),
+        "postings": np.array([d for t in vocab for d in postings[t]], dtype="int64"),
+    }
+
+def term_docs(term_index, word):
+    """Sorted document numbers whose tokens contain word."""
+    joined, offsets = term_index["vocab"], term_index["suffix_offsets"]
+    key = lambda o: joined[o:o + len(word)]
+    lo = bisect.bisect_left(offsets, word, key=key)
+    hi = bisect.bisect_right(offsets, word, lo=lo, key=key)
+    if lo == hi:
+        return np.zeros(0, dtype="int64")
+    bounds = term_index["posting_offsets"]
+    postings = term_index["postings"]
+    tokens = np.unique(term_index["suffix_tokens"][lo:hi])
+    return np.unique(np.concatenate([postings[bounds[t]:bounds[t + 1]] for t in tokens]))
+
+def build_token_index(files, term_index=None, versions=None):
+    """
+    Keyword index used by hybrid scoring. Files whose stored text the prebuilt
+    term_index covers (versions: item id -> version of the stored text they
+    carry) are looked up there; the others are matched on their own text.
+    """
+    doc_numbers = np.full(len(files), -1, dtype="int64")
+    if term_index is not None and versions:
+        docs = term_index["docs"]
+        for pos, f in enumerate(files):
+            entry = docs.get(f.get("id"))
+            if entry and entry[1] is not None and entry[1] == versions.get(f.get("id")):
+                doc_numbers[pos] = entry[0]
+    return {
+        "files": files,
+        "lowered": [None] * len(files),
+        "size": len(files),
+        "terms": term_index,
+        "doc_numbers": doc_numbers,
+    }
+
+def _lowered(token_index, pos):
+    text = token_index["lowered"][pos]
+    if text is None:
+        file = token_index["files"][pos]
+        text = token_index["lowered"][pos] = (file.get("extracted_text") or file.get("name", "")).lower()
+    return text
+
+def _docs_containing(term, token_index):
+    """
+    Boolean mask of documents whose lowercased text contains `term` as a substring
+    ("report" matches "reports,"). Covered documents come from the term index:
+    those holding a token that contains each word of `term`, checked against the
+    text only when `term` is more than one bare word. The rest are checked directly.
+    """
+    mask = np.zeros(token_index["size"], dtype=bool)
+    words = TOKEN_RE.findall(term)
+    doc_numbers = token_index["doc_numbers"]
+    covered = doc_numbers >= 0
+    if token_index["terms"] is not None and words and covered.any():
+        found = None
+        for word in set(words):
+            docs = term_docs(token_index["terms"], word)
+            found = docs if found is None else np.intersect1d(found, docs, assume_unique=True)
+        hits = np.flatnonzero(covered & np.isin(doc_numbers, found))
+        if words == [term]:
+            mask[hits] = True
+        else:
+            mask[[i for i in hits if term in _lowered(token_index, i)]] = True
+        rest = np.flatnonzero(~covered)
+    else:
+        rest = range(token_index["size"])
+    for i in rest:
+        if term in _lowered(token_index, i):
+            mask[i] = True
+    return mask
+
+def hybrid_scores(query, distances, doc_ids, token_index):
+    """
+    Hybrid scores for the given documents at once: -distance plus phrase (0.2),
+    per-keyword (0.02) and year (0.1) bonuses. Keywords match anywhere in the
+    text, inside longer words too.
+    """
+    query_lower = query.lower()
+    keywords = query_lower.split()
+    size = token_index["size"]
+
+    exact_phrase_bonus = np.zeros(size)
+    if keywords:
+        exact_phrase_bonus[_docs_containing(query_lower, token_index)] = 0.2
+
+    keyword_match_count = np.zeros(size)
+    for kw in keywords:
+        keyword_match_count += _docs_containing(kw, token_index)
+
+    year_bonus = np.zeros(size)
+    for word in keywords:
+        if word.isdigit() and len(word) == 4:
+            year_bonus[_docs_containing(word, token_index)] = 0.1
+            break
+
+    # Same summation order as the scalar formula so scores match it exactly
+    scores = -np.asarray(distances, dtype="float64") + exact_phrase_bonus[doc_ids]
+    scores = scores + 0.02 * keyword_match_count[doc_ids]
+    scores = scores + year_bonus[doc_ids]
+    return scores
+
+def score_candidates(query, distances, indices, token_index):
+    """Combine FAISS results with keyword bonuses. Returns (doc ids, scores), best first."""
+    indices = np.asarray(indices)
+    valid = (indices >= 0) & (indices < token_index["size"])
+    doc_ids = indices[valid]
+    scores = hybrid_scores(query, np.asarray(distances)[valid], doc_ids, token_index)
+    order = np.argsort(-scores, kind="stable")
+    return doc_ids[order], scores[order]
+
+NAME_TOKEN_RE = re.compile(r"[a-z0-9]+")  # also splits snake_case and dashed file names
+
+def _name_tokens(text):
+    return NAME_TOKEN_RE.findall((text or "").lower())
+
+def _keyword_overlap(keywords, tokens):
+    """Share of keywords found in tokens; a keyword also matches a longer token it starts (report -> reports)."""
+    if not keywords or not tokens:
+        return 0.0
+    found = sum(1 for kw in keywords if kw in tokens or any(t.startswith(kw) for t in tokens if len(kw) >= 3))
+    return found / len(keywords)
+
+def metadata_score(query, file):
+    """
+    Stage-one score from what Graph returns with every hit: keyword overlap
+    with the name (1.0), folder path (0.3) and description (0.2), the whole
+    query in the name (0.5) and a year in the name/path (0.2) or modified date (0.1).
+    """
+    query_tokens = _name_tokens(query)
+    year = next((t for t in query_tokens if t.isdigit() and len(t) == 4), None)
+    keywords = [t for t in query_tokens if t != year]
+
+    name = (file.get("name") or "").lower()
+    name_tokens = set(_name_tokens(os.path.splitext(name)[0]))
+    path_tokens = set(_name_tokens(file.get("parentReference", {}).get("path", "").split("root:")[-1]))
+    score = _keyword_overlap(keywords, name_tokens)
+    score += 0.3 * _keyword_overlap(keywords, path_tokens)
+    score += 0.2 * _keyword_overlap(keywords, set(_name_tokens(file.get("description"))))
+    if keywords and " ".join(keywords) in " ".join(_name_tokens(name)):
+        score += 0.5
+    if year:
+        if year in name_tokens or year in path_tokens:
+            score += 0.2
+        elif (file.get("lastModifiedDateTime") or "").startswith(year):
+            score += 0.1
+    return score
+
+def prefilter_files(query, files, top_n):
+    """
+    Stage one of search ranking: order files by metadata_score (newest first
+    on ties) and split them into the top_n that go on to text extraction,
+    embedding and hybrid ranking, and the rest. top_n <= 0 keeps everything.
+    """
+    if top_n <= 0 or len(files) <= top_n:
+        return list(files), []
+    by_recency = sorted(files, key=lambda f: f.get("lastModifiedDateTime") or "", reverse=True)
+    ordered = sorted(by_recency, key=lambda f: metadata_score(query, f), reverse=True)
+    return ordered[:top_n], ordered[top_n:]
+
+def rank_files(query, files, top_k=5, index=None, token_index=None):
+    """
+    Rank files against the query entirely in memory. Builds the FAISS index from
+    the files unless a prebuilt one is passed in; pass a token_index from
+    build_token_index to look keywords up in the prebuilt term index.
+    """
+    if not files:
+        return []
+    if index is None:
+        index = build_faiss_index(files)
+    if token_index is None:
+        token_index = build_token_index(files)
 
-    faiss.write_index(index, f"faiss_{index_name}.index")
-    with open(f"{index_name}_metadata.pkl", "wb") as f:
-        pickle.dump(files, f)
+    query_vec = np.array(embed_texts([query])).astype("float32")
+    distances, indices = search_vectors(index, query_vec, len(files))
+    doc_ids, scores = score_candidates(query, distances[0], indices[0], token_index)
 
-    print(f"✅ FAISS index saved as faiss_{index_name}.index")
+    ranked = []
+    for doc_id, score in zip(doc_ids[:top_k], scores[:top_k]):
+        file = files[doc_id]
+        file["hybrid_score"] = float(score)
+        ranked.append(file)
+    return ranked
 
 def rank_files_by_similarity(query, top_k=5, index_name="file"):
+    """Rank against an index previously saved with build_faiss_index(..., persist=True)."""
     if not os.path.exists(f"faiss_{index_name}.index") or not os.path.exists(f"{index_name}_metadata.pkl"):
         print("❌ FAISS index or metadata missing.")
         return []
@@ -51,40 +367,4 @@ def rank_files_by_similarity(query, top_k=5, index_name="file"):
     with open(f"{index_name}_metadata.pkl", "rb") as f:
         files = pickle.load(f)
 
-    query_embedding = client.embeddings.create(
-        input=[query],
-        model="text-embedding-3-small"
-    ).data[0].embedding
-    query_vec = np.array([query_embedding]).astype("float32")
-
-    distances, indices = index.search(query_vec, len(files))
-
-    def hybrid_score(file, distance):
-        text = (file.get("extracted_text") or file.get("name", "")).lower()
-        query_lower = query.lower()
-        keywords = query_lower.split()
-
-        exact_phrase_bonus = 0.2 if query_lower in text else 0
-        keyword_match_count = sum(1 for kw in keywords if kw in text)
-        keyword_bonus = 0.02 * keyword_match_count
-
-        year_bonus = 0
-        for word in keywords:
-            if word.isdigit() and len(word) == 4:
-                if word in text:
-                    year_bonus = 0.1
-                break
-
-        score = -float(distance) + exact_phrase_bonus + keyword_bonus + year_bonus
-        return float(score)
-
-    scored_files = []
-    for idx, dist in zip(indices[0], distances[0]):
-        if 0 <= idx < len(files):
-            file = files[idx]
-            score = hybrid_score(file, dist)
-            file["hybrid_score"] = float(score)
-            scored_files.append(file)
-
-    sorted_files = sorted(scored_files, key=lambda f: f["hybrid_score"], reverse=True)
-    return sorted_files[:top_k]
+    return rank_files(query, files, top_k=top_k, index=index)
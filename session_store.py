@@ -0,0 +1,179 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from flask import g
+from flask_session import Session
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+
+logging.basicConfig(level=logging.INFO)
+
+# filesystem: one file per session in flask_session/ (single process only)
+# sqlite: one WAL-mode database, shared by every worker on the host
+# redis: any Redis-protocol server, shared across hosts (needs the redis package)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "filesystem").lower()
+SESSION_DIR = os.path.join(os.getcwd(), "flask_session")
+SESSION_SQLITE_DB = os.getenv("SESSION_SQLITE_DB", "sessions.db")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+# Expired SQLite sessions are deleted at most this often per worker (also: `flask session_cleanup`)
+SESSION_SWEEP_SECONDS = int(os.getenv("SESSION_SWEEP_SECONDS", "300"))
+
+_stats = {
+    "reads": 0, "read_ms": 0.0, "max_read_ms": 0.0,
+    "writes": 0, "write_ms": 0.0, "max_write_ms": 0.0,
+    "sweeps": 0, "expired_deleted": 0,
+}
+_stats_lock = threading.Lock()
+_backend = None
+
+
+def _record(kind, ms):
+    with _stats_lock:
+        _stats[f"{kind}s"] += 1
+        _stats[f"{kind}_ms"] += ms
+        _stats[f"max_{kind}_ms"] = max(_stats[f"max_{kind}_ms"], ms)
+
+
+class SQLiteSession(ServerSideSession):
+    pass
+
+
+class SQLiteSessionInterface(ServerSideSessionInterface):
+    """Sessions in a WAL-mode SQLite table; safe for several processes writing at once."""
+
+    session_class = SQLiteSession
+    ttl = False  # expiry is enforced on read and swept periodically
+
+    def __init__(self, app, db_path=SESSION_SQLITE_DB, sweep_seconds=SESSION_SWEEP_SECONDS, **kwargs):
+        self.db_path = db_path
+        self.sweep_seconds = sweep_seconds
+        self._last_sweep = time.monotonic()
+        self._init_db()
+        super().__init__(app, **kwargs)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('PRAGMA journal_mode=WAL')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                store_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expiry REAL NOT NULL
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions (expiry)')
+        conn.commit()
+        conn.close()
+
+    def _retrieve_session_data(self, store_id):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('SELECT data FROM sessions WHERE store_id = ? AND expiry > ?', (store_id, time.time()))
+        row = c.fetchone()
+        conn.close()
+        return self.serializer.decode(row[0]) if row else None
+
+    def _delete_session(self, store_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM sessions WHERE store_id = ?', (store_id,))
+        conn.commit()
+        conn.close()
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        data = self.serializer.encode(session)
+        conn = self._connect()
+        # One statement, so concurrent writers to the same session never see a half-written row
+        conn.execute('''
+            INSERT INTO sessions (store_id, data, expiry) VALUES (?, ?, ?)
+            ON CONFLICT(store_id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry
+        ''', (store_id, data, time.time() + session_lifetime.total_seconds()))
+        conn.commit()
+        conn.close()
+        if time.monotonic() - self._last_sweep >= self.sweep_seconds:
+            self._last_sweep = time.monotonic()
+            self._delete_expired_sessions()
+
+    def _delete_expired_sessions(self):
+        conn = self._connect()
+        deleted = conn.execute('DELETE FROM sessions WHERE expiry <= ?', (time.time(),)).rowcount
+        conn.commit()
+        conn.close()
+        with _stats_lock:
+            _stats["sweeps"] += 1
+            _stats["expired_deleted"] += deleted
+        if deleted:
+            logging.info(f"🧹 Deleted {deleted} expired sessions")
+
+
+class TimedSessionInterface:
+    """
+    Wraps a session interface to time every session read and write. Totals
+    go to session_stats(); each response gets them in a Server-Timing header.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        session = self.inner.open_session(app, request)
+        g.session_read_ms = (time.perf_counter() - started) * 1000
+        _record("read", g.session_read_ms)
+        return session
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        self.inner.save_session(app, session, response)
+        write_ms = (time.perf_counter() - started) * 1000
+        _record("write", write_ms)
+        response.headers.add(
+            "Server-Timing", f"session-read;dur={g.get('session_read_ms', 0):.2f}, session-write;dur={write_ms:.2f}"
+        )
+
+
+def init_session(app, backend=None):
+    """Install the session backend on app; use in place of Session(app)."""
+    global _backend
+    backend = (backend or SESSION_BACKEND).lower()
+    if backend == "sqlite":
+        inner = SQLiteSessionInterface(
+            app,
+            key_prefix=app.config.get("SESSION_KEY_PREFIX", "session:"),
+            permanent=app.config.get("SESSION_PERMANENT", True),
+        )
+    elif backend == "redis":
+        from redis import Redis
+        app.config["SESSION_TYPE"] = "redis"
+        app.config["SESSION_REDIS"] = Redis.from_url(SESSION_REDIS_URL)
+        Session(app)
+        inner = app.session_interface
+    elif backend == "filesystem":
+        os.makedirs(SESSION_DIR, exist_ok=True)
+        app.config["SESSION_TYPE"] = "filesystem"
+        Session(app)
+        inner = app.session_interface
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND '{backend}' (filesystem, sqlite or redis)")
+    app.session_interface = TimedSessionInterface(inner)
+    _backend = backend
+    logging.info(f"🗝️ Sessions stored in {backend}")
+
+
+def session_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    for kind in ("read", "write"):
+        count = stats[f"{kind}s"]
+        stats[f"avg_{kind}_ms"] = round(stats[f"{kind}_ms"] / count, 2) if count else None
+        stats[f"{kind}_ms"] = round(stats[f"{kind}_ms"], 1)
+        stats[f"max_{kind}_ms"] = round(stats[f"max_{kind}_ms"], 2)
+    stats["backend"] = _backend
+    return stats